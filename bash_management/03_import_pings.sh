@@ -13,8 +13,8 @@ do
   time curl --header "Content-Type: application/json" \
     --header "Authorization: Token $CC_TOKEN" \
     --request POST \
-    --data @"$FN" \
-    "${CC_HOST}api/import/pings/?nocheck=1"
+    --data-binary @"$FN" \
+    "${CC_HOST}api/import/pings/?nocheck=1&stream=1"
   echo
   echo
 done
@@ -1,37 +1,76 @@
-from typing import List
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-from django.db.models import QuerySet, F
+from django.db import transaction
+from django.db.models import QuerySet, F, Exists, OuterRef
+from django.utils import timezone
 
-from classify.models import DetectionScore
+from classify.models import DetectionScore, DetectionLease
 from database.models import Detection
 from users.models import User
 
 
-def find_unclassified_by_user(user: User, kind: str, count=1, own_qs: QuerySet = None) -> List[Detection]:
+def find_unclassified_by_user(user: User, kind: str, count=1, own_qs: QuerySet = None, lease: Optional[timedelta] = None) -> List[Detection]:
     """
     List of hits to classify (excluding just classified)
+
+    Hits just classified by user and hits leased to any user are excluded by NOT EXISTS subqueries,
+    so only one SELECT and one UPDATE of score (and INSERT of leases) are executed.
+    On PostgreSQL selected rows are locked by FOR UPDATE SKIP LOCKED, so concurrent classifiers get different hits.
+
     :param user: for filter unclassified by user
     :param kind: kind of classification, @see Attribute.kind
     :param count: count hits to get
     :param own_qs: filtered queryset of hits
+    :param lease: when set then hits are also leased to user for this time, see: lease_unclassified_by_user()
     :return: list of unclassified hits
     """
-    ret = []
-    tries = 100  # TODO: find better solution for select from Detection without related Score entity
-    uqs = Detection.objects.all() if own_qs is None else own_qs
+    if lease is not None:
+        return lease_unclassified_by_user(user, kind, lease, count, own_qs)[0]
+
+    with transaction.atomic():
+        ret = _select_unclassified(user, kind, count, own_qs, timezone.now())
+        Detection.objects.filter(id__in=[d.id for d in ret]).update(score=F('score') + 1)
+    return ret
+
+
+def lease_unclassified_by_user(user: User, kind: str, lease: timedelta, count=1, own_qs: QuerySet = None) -> Tuple[List[Detection], datetime]:
+    """
+    Lease hits to classify to user, the leased hits are not returned to other users until lease expires
+    or is released by release_leases(). Score of leased hits is incremented like in find_unclassified_by_user(),
+    so next hits are handed out to the next users.
+    :param user: for filter unclassified by user
+    :param kind: kind of classification, @see Attribute.kind
+    :param lease: time of lease
+    :param count: count hits to get
+    :param own_qs: filtered queryset of hits
+    :return: tuple of (list of leased hits, expiry time stored in leases)
+    """
+    now = timezone.now()
+    expires = now + lease
+    with transaction.atomic():
+        ret = _select_unclassified(user, kind, count, own_qs, now)
+        Detection.objects.filter(id__in=[d.id for d in ret]).update(score=F('score') + 1)
+        DetectionLease.objects.filter(kind=kind, expires__lte=now).delete()
+        DetectionLease.objects.bulk_create([
+            DetectionLease(user=user, detection=d, kind=kind, expires=expires) for d in ret
+        ], ignore_conflicts=True)
+    return ret, expires
 
-    while len(ret) < count and tries > 0:
-        ids = []
-        qs = uqs.filter(has_image=True).order_by('score', 'random')[:count]
 
-        for d in qs:
-            if not DetectionScore.has(user, d, kind):
-                ret.append(d)
-                ids.append(d.id)
-            if len(ret) >= count:
-                break
+def _select_unclassified(user: User, kind: str, count: int, own_qs: Optional[QuerySet], now: datetime) -> List[Detection]:
+    uqs = Detection.objects.all() if own_qs is None else own_qs
+    classified = DetectionScore.objects.filter(user=user, kind=kind, detection=OuterRef('pk'))
+    leased = DetectionLease.objects.filter(kind=kind, detection=OuterRef('pk'), expires__gt=now)
+    qs = uqs.filter(has_image=True).filter(~Exists(classified), ~Exists(leased)).order_by('score', 'random')
+    return list(qs.select_for_update(skip_locked=True, of=('self',))[:count])
 
-        Detection.objects.filter(id__in=ids).update(score=F('score') + 1)
-        tries -= 1
 
-    return ret
+def release_leases(user: User, kind: str, detection_ids: List[int]) -> None:
+    """
+    Release leases of just classified hits.
+    :param user: author of classify
+    :param kind: kind of classification, @see Attribute.kind
+    :param detection_ids: classified hits
+    """
+    DetectionLease.objects.filter(user=user, kind=kind, detection_id__in=detection_ids).delete()
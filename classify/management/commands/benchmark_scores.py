@@ -0,0 +1,67 @@
+import time
+from typing import Tuple
+
+from django.core.management import BaseCommand
+from django.db import transaction, connection
+from django.test.utils import CaptureQueriesContext
+
+from classify.models import DetectionScore
+from database.management.commands.benchmark_ingest import BENCHMARK_ID, make_detections
+from database.models import Team, CredoUser, Device, Detection
+from users.models import User
+
+
+def legacy_set_new_points(user: User, detection: Detection, kind: str, score: int = 1) -> Tuple[float, float]:
+    """
+    The DetectionScore.set_new_points() before upsert: select, delete and create of score.
+    """
+    c = DetectionScore.objects.filter(user=user, detection=detection, kind=kind).first()
+    v = score
+    s = score
+    if c is not None:
+        if c.verified:
+            v -= c.score
+        s -= c.score
+        c.delete()
+    DetectionScore.objects.create(user=user, detection=detection, kind=kind, score=score)
+    return s, v
+
+
+class Command(BaseCommand):
+    help = 'Compare count of queries and time of DetectionScore.set_new_points() with the legacy select, delete and create, all changes are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--count', type=int, help='count of classified detections', default=1000)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        print('DB engine: %s' % connection.vendor)
+
+        for name, func in [
+            ('legacy', lambda u, d: legacy_set_new_points(u, d, 'co', 1)),
+            ('upsert', lambda u, d: DetectionScore.set_new_points(u, d.id, 'co', 1)),
+        ]:
+            with transaction.atomic():
+                team = Team.objects.create(id=BENCHMARK_ID, name='benchmark-%d' % BENCHMARK_ID)
+                credo_user = CredoUser.objects.create(id=BENCHMARK_ID, username='benchmark', display_name='benchmark')
+                Device.objects.create(id=BENCHMARK_ID, device_model='benchmark', system_version='benchmark', user=credo_user)
+                user = User.objects.create(username='benchmark-%d' % BENCHMARK_ID)
+                detections = make_detections(count, 0)
+                Detection.objects.bulk_create(detections, batch_size=100)
+
+                # first classification creates scores, the second one updates them
+                for step in ['create', 'update']:
+                    s_sum = 0
+                    v_sum = 0
+                    start = time.time()
+                    with CaptureQueriesContext(connection) as queries:
+                        for d in detections:
+                            s, v = func(user, d)
+                            s_sum += s
+                            v_sum += v
+                    elapsed = time.time() - start
+                    print('%s %s: %.2f queries per classification, %.3f ms per classification, s: %g, v: %g' % (
+                        name, step, len(queries.captured_queries) / count, elapsed * 1000 / count, s_sum, v_sum
+                    ))
+
+                transaction.set_rollback(True)
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 11:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('database', '0002_detection_crop_store'),
+        ('classify', '0002_auto_20200526_1738'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('b', 'Build-in'), ('c', 'Classification by user'), ('cs', 'Scaled classification (1 to 5)'), ('co', 'One class'), ('o', 'Others')], max_length=2)),
+                ('expires', models.DateTimeField(db_index=True, verbose_name='Expires')),
+                ('detection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='database.Detection', verbose_name='Detection')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Leased detection',
+                'verbose_name_plural': 'Leased detections',
+                'default_permissions': ('view', 'add', 'change', 'delete'),
+                'unique_together': {('detection', 'kind')},
+            },
+        ),
+    ]
@@ -1,9 +1,11 @@
-from typing import Tuple
+from typing import Dict, Tuple, Union
 
-from django.db import models
+from django.db import models, connections, router
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from credo_classification.drf import DjangoPlusViewPermissionsMixin
+from database.ingest import upsert
 from database.models import Detection
 from definitions.models import Attribute
 from users.models import User
@@ -26,24 +28,66 @@ class DetectionScore(models.Model):
     verified = models.BooleanField(default=False)
 
     @staticmethod
-    def set_new_points(user: User, detection: Detection, kind: str, score: int = 1) -> Tuple[float, float]:
+    def set_new_points(user: User, detection: Union[Detection, int], kind: str, score: int = 1) -> Tuple[float, float]:
         """
         Create or update score for classify.
+
+        On PostgreSQL score is upserted and diffs are computed by one INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+        statement, on other engines by bulk_set_new_points().
+
         :param user: author of classify
-        :param detection: classified hit
+        :param detection: classified hit or its ID
         :param kind: kind of classification, @see Attribute.kind
         :param score: unverified scores for classify hit
         :return: tuple: s, v where s - all scores diff, v - verified scores diff
         """
-        c = DetectionScore.objects.filter(user=user, detection=detection, kind=kind).first()
-        v = score
-        s = score
-        if c is not None:
-            if c.verified:
-                v -= c.score
-            s -= c.score
-            c.delete()
-        DetectionScore.objects.create(user=user, detection=detection, kind=kind, score=score)
+        detection_id = detection.pk if isinstance(detection, Detection) else detection
+        connection = connections[router.db_for_write(DetectionScore)]
+        if connection.vendor != 'postgresql':
+            return DetectionScore.bulk_set_new_points(user, kind, {detection_id: score})
+
+        qn = connection.ops.quote_name
+        sql = """
+            WITH prev AS (
+                SELECT score, verified FROM {table} WHERE user_id = %s AND detection_id = %s AND kind = %s
+            ), upserted AS (
+                INSERT INTO {table} (user_id, detection_id, kind, date, score, verified) VALUES (%s, %s, %s, %s, %s, false)
+                ON CONFLICT (user_id, detection_id, kind) DO UPDATE SET date = EXCLUDED.date, score = EXCLUDED.score, verified = EXCLUDED.verified
+                RETURNING score
+            )
+            SELECT upserted.score - COALESCE(prev.score, 0), upserted.score - COALESCE(CASE WHEN prev.verified THEN prev.score END, 0)
+            FROM upserted LEFT JOIN prev ON true
+        """.format(table=qn(DetectionScore._meta.db_table))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, detection_id, kind, user.pk, detection_id, kind, timezone.now(), score])
+            s, v = cursor.fetchone()
+        return s, v
+
+    @staticmethod
+    def bulk_set_new_points(user: User, kind: str, points: Dict[int, int]) -> Tuple[float, float]:
+        """
+        Create or update scores for classify of many hits by one query for existing scores and one upsert query.
+        :param user: author of classify
+        :param kind: kind of classification, @see Attribute.kind
+        :param points: unverified scores for classify by ID of classified hit
+        :return: tuple: s, v where s - all scores diff, v - verified scores diff, sum for all hits
+        """
+        s = 0
+        v = 0
+        existing = DetectionScore.objects.filter(user=user, kind=kind, detection_id__in=points.keys()).values_list('detection_id', 'score', 'verified')
+        old = {detection_id: (score, verified) for detection_id, score, verified in existing}
+        for detection_id, score in points.items():
+            s += score
+            v += score
+            if detection_id in old:
+                c_score, c_verified = old[detection_id]
+                if c_verified:
+                    v -= c_score
+                s -= c_score
+
+        upsert(DetectionScore, [
+            DetectionScore(user=user, detection_id=detection_id, kind=kind, score=score) for detection_id, score in points.items()
+        ], ['user', 'detection', 'kind'], ['date', 'score', 'verified'])
         return s, v
 
     @staticmethod
@@ -61,3 +105,22 @@ class DetectionScore(models.Model):
         verbose_name = _('Classified detection')
         verbose_name_plural = _('Classified detections')
         unique_together = [['user', 'detection', 'kind']]
+
+
+class DetectionLease(models.Model):
+    """
+    Detection handed out to user in batch of classification queue.
+
+    Until expires the detection is not handed out to other users. When user not classify it
+    before expires then the detection go back to the pool of unclassified detections.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_('User'))
+    detection = models.ForeignKey(Detection, on_delete=models.CASCADE, verbose_name=_('Detection'))
+    kind = models.CharField(max_length=2, choices=Attribute.KIND_CHOICES)
+    expires = models.DateTimeField(db_index=True, verbose_name=_('Expires'))
+
+    class Meta(DjangoPlusViewPermissionsMixin):
+        verbose_name = _('Leased detection')
+        verbose_name_plural = _('Leased detections')
+        unique_together = [['detection', 'kind']]
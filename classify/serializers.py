@@ -5,8 +5,7 @@ from django.utils.translation import gettext_lazy as _
 
 from database.models import Team, CredoUser, Device, Ping, Detection
 from database.serializers import DeviceSerializer
-from definitions.models import Attribute
-from definitions.serializers import AttributeSerializer
+from definitions.cache import get_serialized_attributes
 
 
 class DetectionClassifySerializer(ModelSerializer):
@@ -19,11 +18,11 @@ class DetectionClassifySerializer(ModelSerializer):
         return o.get_file_url()
 
     def get_attributes(self, o: Detection) -> List[dict]:
-        ret = []
-        for a in Attribute.objects.filter(kind='c', active=True):
-            ret.append(AttributeSerializer(a).data)
-        return ret
+        # resolved once per serialization (the context is shared by all rows when many=True)
+        if 'attributes' not in self.context:
+            self.context['attributes'] = get_serialized_attributes(kind='c', active=True)
+        return self.context['attributes']
 
     class Meta:
         model = Detection
-        fields = '__all__'
+        exclude = ['frame_content', 'frame_offset', 'frame_size']  # content of crop is served by image URL from crop store
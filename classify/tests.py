@@ -1,3 +1,57 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from classify.models import DetectionLease
+from database.models import Detection
+from database.tests import create_detections
+from definitions.models import Attribute
+from users.models import User
+
+
+CLASSIFY_ONE_URL = '/' + settings.BASE_URL + 'api/classify/one/'
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BatchClassifyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('classifier')
+        cls.other = User.objects.create_user('other')
+        create_detections(7)
+        Attribute.objects.create(name='class', author=cls.user, active=True, kind='c')
+
+    def client_for(self, user: User) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_batch(self):
+        client = self.client_for(self.user)
+        response = client.get(CLASSIFY_ONE_URL + '?batch=1&count=5')
+        self.assertEqual(response.status_code, 200)
+        leased = [d['id'] for d in response.data['detections']]
+        self.assertEqual(len(leased), 5)
+        self.assertEqual(response.data['detection']['id'], leased[0])
+
+        leases = DetectionLease.objects.filter(user=self.user)
+        self.assertEqual(sorted(leases.values_list('detection_id', flat=True)), sorted(leased))
+        self.assertEqual(dict(Detection.objects.values_list('id', 'score')), {i: 1 if i in leased else 0 for i in range(1, 8)})
+        self.assertEqual(set(leases.values_list('expires', flat=True)), {response.data['expires']})
+
+        # classification from local queue releases lease and not leases next hits
+        response = client.post(CLASSIFY_ONE_URL + '?batch=1', {'id': leased[0], 'attribute': 'class', 'value': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data.keys()), {'user'})
+        self.assertEqual(sorted(leases.values_list('detection_id', flat=True)), sorted(leased[1:]))
+
+        # leased hits are not handed out to other user
+        response = self.client_for(self.other).get(CLASSIFY_ONE_URL + '?batch=1&count=5')
+        self.assertEqual(sorted(d['id'] for d in response.data['detections']), sorted({1, 2, 3, 4, 5, 6, 7} - set(leased[1:])))
+
+    def test_without_batch(self):
+        client = self.client_for(self.user)
+        response = client.post(CLASSIFY_ONE_URL, {'id': 1, 'attribute': 'class', 'value': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['detection']['id'], 1)
+        self.assertFalse(DetectionLease.objects.exists())
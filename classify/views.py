@@ -1,9 +1,10 @@
+from datetime import timedelta
 from typing import Dict
 
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from classify.helpers import find_unclassified_by_user
+from classify.helpers import find_unclassified_by_user, lease_unclassified_by_user, release_leases
 from classify.models import DetectionScore
 from classify.serializers import DetectionClassifySerializer
 from database.models import Detection
@@ -13,21 +14,47 @@ from values.models import DetectionAttribute
 
 class BaseRandomToClassify(APIView):
     kind = None
+    lease_time = timedelta(minutes=10)  # time for classify of hits returned in batch
 
     def get_filtered_hits(self):
         user = self.request.query_params.get('user', '')
         team = self.request.query_params.get('team', '')
-        qs = Detection.objects.all()
+        qs = Detection.objects.select_related('device').defer('frame_content')
         if user:
             qs = qs.filter(user_id=user)
         if team:
             qs = qs.filter(team_id=team)
         return qs
 
+    def batch_exists(self) -> bool:
+        return bool(self.request.query_params.get('batch'))
+
     def get_next_to_classify(self):
+        """
+        Next hits to classify.
+
+        Default only the first hit is returned in detection field.
+
+        When /?batch=1 then all count hits are returned in detections field and are leased to user
+        until the time in expires field. Client should classify them from its local queue and ask
+        for next batch when the queue is almost empty. Hits not classified before expires
+        go back to the pool for other users.
+        """
         user = self.request.user
-        count = int(self.request.query_params.get('count', '1'))
-        ucs = find_unclassified_by_user(user, self.kind, min(count, 100), self.get_filtered_hits())
+        count = min(int(self.request.query_params.get('count', '1')), 100)
+        if self.batch_exists():
+            ucs, expires = lease_unclassified_by_user(user, self.kind, self.lease_time, count, self.get_filtered_hits())
+            if len(ucs) > 0:
+                detections = DetectionClassifySerializer(ucs, many=True).data
+                return Response({
+                    'user': UserViewSerializer(user).data,
+                    'detection': detections[0],
+                    'detections': detections,
+                    'expires': expires
+                })
+            return Response(status=404)
+
+        ucs = find_unclassified_by_user(user, self.kind, count, self.get_filtered_hits())
         if len(ucs) > 0:
             return Response({
                 'user': UserViewSerializer(user).data,
@@ -36,6 +63,17 @@ class BaseRandomToClassify(APIView):
         else:
             return Response(status=404)
 
+    def get_response_after_classify(self):
+        """
+        Response of POST with classification.
+
+        When /?batch=1 then the client classifies hits from its local queue, so only user with updated scores
+        is returned, otherwise the next hit to classify like in GET.
+        """
+        if self.batch_exists():
+            return Response({'user': UserViewSerializer(self.request.user).data})
+        return self.get_next_to_classify()
+
     def get(self, request, *args, **kwargs):
         return self.get_next_to_classify()
 
@@ -57,8 +95,9 @@ class RandomToClassifyOne(BaseRandomToClassify):
             value=value
         )
 
-        user.fast_update_scores(*DetectionScore.set_new_points(user, ret.detection, 'co', 1))
-        return self.get_next_to_classify()
+        user.fast_update_scores(*DetectionScore.set_new_points(user, ret.detection_id, 'co', 1))
+        release_leases(user, self.kind, [detection_id])
+        return self.get_response_after_classify()
 
 
 random_to_classify_one  = RandomToClassifyOne.as_view()
@@ -73,23 +112,13 @@ class RandomToClassifyScaled(BaseRandomToClassify):
         classes = data.get('classes')  # type: Dict[str, int]
         user = request.user
 
-        points = 0
-        detection = None
-
-        for k, v in classes.items():
-            ret, created = DetectionAttribute.set_or_update_value(
-                detection_id=detection_id,
-                user=user,
-                attribute=k,
-                value=v
-            )
-            detection = ret.detection
-            if created:
-                points += 1
-
-        if len(classes.keys()) and detection is not None:
-            user.fast_update_scores(*DetectionScore.set_new_points(user, detection, 'cs', points))
-        return self.get_next_to_classify()
+        created = DetectionAttribute.bulk_set_or_update_values(user, [(detection_id, k, v) for k, v in classes.items()])
+        points = sum(created)
+
+        if len(classes.keys()):
+            user.fast_update_scores(*DetectionScore.bulk_set_new_points(user, 'cs', {detection_id: points}))
+        release_leases(user, self.kind, [detection_id])
+        return self.get_response_after_classify()
 
 
 random_to_classify_scaled = RandomToClassifyScaled.as_view()
@@ -105,23 +134,10 @@ class RandomToClassifySelect(BaseRandomToClassify):
         detections = data.get('detections')
         user = request.user
 
-        us = 0
-        uv = 0
-
-        for detection_id in detections:
-            ret, created = DetectionAttribute.set_or_update_value(
-                detection_id=detection_id,
-                user=user,
-                attribute=name,
-                value=value
-            )
-
-            s, v = DetectionScore.set_new_points(user, ret.detection, 'co', 1)
-            us += s
-            uv += v
-
-        user.fast_update_scores(us, uv)
-        return self.get_next_to_classify()
+        DetectionAttribute.bulk_set_or_update_values(user, [(detection_id, name, value) for detection_id in detections])
+        user.fast_update_scores(*DetectionScore.bulk_set_new_points(user, 'co', {detection_id: 1 for detection_id in detections}))
+        release_leases(user, self.kind, detections)
+        return self.get_response_after_classify()
 
 
 random_to_classify_select = RandomToClassifySelect.as_view()
@@ -2,14 +2,17 @@ import argparse
 import re
 import sys
 from argparse import Namespace
-import pickle
+from functools import partial
+from itertools import islice
 
 from hit_analysis.batch.load_detections import analyse_detections_batch
 from hit_analysis.commons.config import Config
+from hit_analysis.commons.consts import FRAME_CONTENT
 from hit_analysis.image.image_utils import detection_load_parser
-from hit_analysis.io.csv_write import gen_csv_header, write_to_csv
+from hit_analysis.io.csv_write import CsvWriter, CSV_DISCOVER_ROWS
+from hit_analysis.io.image_cache import ImageCache
 from hit_analysis.io.io_utils import progress_and_process_image
-from hit_analysis.io.load_write import load_json
+from hit_analysis.io.load_write import load_json, serialize, deserialize
 from hit_analysis.sandbox.sandbox_analysis import sandbox_analysis
 
 
@@ -18,17 +21,28 @@ def main():
     parser.add_argument('-d', '--datatype', help='data to import from input: users, devices, teams, hits or pings')
     parser.add_argument('-o', '--out-dir', help='path to store debug data. For hits: png files accepterd, rejected and suspicious (but inserted)', default='')
     parser.add_argument('-i', '--input-file', help='input JSON file, default: stdin', default='-')
-    parser.add_argument('-s', '--serialize', help='serialize result to file')
+    parser.add_argument('-s', '--serialize', help='serialize result to file (and crops to file with .blob suffix)')
     parser.add_argument('-l', '--load', help='load for serialized (required for "sandbox" working set)')
     parser.add_argument('-w', '--working-set', help='standard, sandbox', default='standard')
+    parser.add_argument('--workers', type=int, help='count of processes for analysis of hits grouped by device_id', default=1)
+    parser.add_argument('--image-cache', help='directory for cache of decoded images, reused by next runs with the same input')
+    parser.add_argument('--image-cache-size', type=int, help='max size of cache of decoded images in MB', default=1024)
+    parser.add_argument('--csv-stream', action='store_true', help='write CSV rows of each device as soon as are analysed (rows are grouped by device_id), '
+                                                                 'only columns of known detection fields are written, other keys of input JSON are omitted')
+    parser.add_argument('--csv-all-keys', action='store_true', help='scan keys of all detections for CSV columns, '
+                                                                   'default: only first %d detections are scanned for keys out of known detection fields' % CSV_DISCOVER_ROWS)
     options = parser.parse_args()  # type: Namespace
 
     datatype = options.datatype
     out_dir = options.out_dir
     input_file = options.input_file
     working_set = options.working_set
-    serialize = options.serialize
+    serialize_file = options.serialize
     load = options.load
+    workers = options.workers
+    csv_stream = options.csv_stream
+    csv_all_keys = options.csv_all_keys
+    cache = ImageCache(options.image_cache, options.image_cache_size * 1024 * 1024) if options.image_cache else None
 
     config = Config(out_dir)
 
@@ -37,20 +51,24 @@ def main():
             print('Other datatypes than hits is not supported yet')
 
         if datatype == 'hits':
-            objects, count = load_json(input_file, progress_and_process_image)
-            analyse_detections_batch(objects, config)
+            objects, count = load_json(input_file, partial(progress_and_process_image, cache=cache))
 
             with open('%s/output.csv' % out_dir, 'w', newline='') as csvfile:
-                opt = gen_csv_header(objects)
-                write_to_csv(csvfile, objects, opt, exclude={'frame_content'}, regex_exclude=[re.compile('image_brighter_count_\\d\\d\\d')])
+                writer = CsvWriter(csvfile, exclude={FRAME_CONTENT}, regex_exclude=[re.compile('image_brighter_count_\\d\\d\\d')])
+                if csv_stream:
+                    writer.write_header()
+                    analyse_detections_batch(objects, config, workers, lambda device_id, detections: writer.write(detections))
+                else:
+                    analyse_detections_batch(objects, config, workers)
+                    writer.add_columns(objects if csv_all_keys else islice(objects, CSV_DISCOVER_ROWS))
+                    writer.write_header()
+                    writer.write(objects)
 
-            if serialize:
-                with open(serialize, 'wb') as f:
-                    pickle.dump(objects, f)
+            if serialize_file:
+                serialize(serialize_file, objects)
     elif working_set == 'sandbox':
-        with open(load, "rb") as f:
-            objects = pickle.load(f)
-            sandbox_analysis(objects, config)
+        objects = deserialize(load)
+        sandbox_analysis(objects, config)
 
 
 if __name__ == "__main__":
@@ -135,6 +135,9 @@ APP_SITE = os.environ.get('CREDO_DEPLOY_SITE', 'test')
 APP_NAME = 'CREDO Classify'
 APP_VERSION = '0.1-alpha'
 BASE_URL = os.environ.get('CREDO_ENDPOINT', 'user-interface/classification/')
+CROP_STORE = os.environ.get('CREDO_CROP_STORE', 'db')  # where crops are stored on import: 'db' - Detection.frame_content, 'fs' - sharded directory, 'blob' - packed file
+CROP_STORE_PATH = os.environ.get('CREDO_CROP_STORE_PATH', os.path.join(BASE_DIR, 'crops'))  # directory for 'fs' and 'blob' crop store
+INGEST_BACKEND = os.environ.get('CREDO_INGEST_BACKEND', 'orm')  # 'orm' - bulk_create, 'copy' - COPY FROM STDIN on PostgreSQL (bulk_create on others)
 
 # Django REST Framework
 
@@ -22,7 +22,7 @@ from rest_framework import routers
 
 from classify.views import random_to_classify_scaled, random_to_classify_one, random_to_classify_select
 from credo_classification.views import home
-from database.views import ImportTeams, ImportCredoUsers, ImportDevices, ImportPings, ImportDetections, serve_image, CheckUserTeamIdView
+from database.views import ImportTeams, ImportCredoUsers, ImportDevices, ImportPings, ImportDetections, serve_image, serve_sprite, CheckUserTeamIdView, ExportDetections
 from definitions.views import AttributeViewSet
 from users.views import obtain_auth_token, void_token, reset_password, auth_by_detector
 
@@ -42,10 +42,12 @@ urlpatterns = [
   url(r'^api/import/pings/', ImportPings.as_view()),
   url(r'^api/import/detections/', ImportDetections.as_view()),
   url(r'^api/database/check/', CheckUserTeamIdView.as_view()),
+  url(r'^api/export/detections/', ExportDetections.as_view()),
   url(r'^api/classify/one/', random_to_classify_one),
   url(r'^api/classify/scaled/', random_to_classify_scaled),
   url(r'^api/classify/select/', random_to_classify_select),
   url(r'^api/', include(router.urls)),
+  url(r'^images/sprite/', serve_sprite),
   url(r'^images/(?P<detection_id>\d+)\.[a-zA-Z0-9]+', serve_image),
 ] + [url(r'^(?P<path>.*)$', serve)]
 
@@ -0,0 +1,180 @@
+import fcntl
+import io
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import BinaryIO, Optional, Iterator
+
+from django.conf import settings
+
+from database.models import Detection
+
+
+class CropStore:
+    """
+    Storage of content of cropped images (frame_content) of detections.
+
+    The put() is called before insert of detection to DB, so it may set fields of detection
+    used by open() to find content later.
+    """
+
+    def put(self, detection: Detection, content: bytes) -> None:
+        """
+        Store content of crop of detection.
+        :param detection: detection, not saved yet
+        :param content: content of image file, usually PNG
+        """
+        raise NotImplementedError()
+
+    def open(self, detection: Detection) -> Optional[BinaryIO]:
+        """
+        Open stored content of crop of detection.
+        :param detection: detection with fields set by put()
+        :return: binary file object or None when content was not stored
+        """
+        raise NotImplementedError()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Context of many put() calls, i.e. one import batch, the store may keep its resources open inside.
+        """
+        yield
+
+    def read(self, detection: Detection) -> Optional[bytes]:
+        """
+        Read whole stored content of crop of detection.
+        :param detection: detection with fields set by put()
+        :return: content of image file or None when content was not stored
+        """
+        f = self.open(detection)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+
+class DbCropStore(CropStore):
+    """
+    Crop stored in Detection.frame_content column.
+    """
+
+    def put(self, detection: Detection, content: bytes) -> None:
+        detection.frame_content = content
+
+    def open(self, detection: Detection) -> Optional[BinaryIO]:
+        if detection.frame_content is None:
+            return None
+        return io.BytesIO(detection.frame_content)
+
+
+class FileCropStore(CropStore):
+    """
+    Crop stored in file named by Detection.get_file_name() in directory sharded by id,
+    i.e. crop of detection 123456789 is stored in ``directory/123/456/123456789.png``.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def get_path(self, detection: Detection) -> str:
+        name = detection.get_file_name()
+        return os.path.join(self.directory, name[0:3], name[3:6], name)
+
+    def put(self, detection: Detection, content: bytes) -> None:
+        path = self.get_path(detection)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+        detection.frame_content = None
+
+    def open(self, detection: Detection) -> Optional[BinaryIO]:
+        try:
+            return open(self.get_path(detection), 'rb')
+        except FileNotFoundError:
+            return None
+
+
+class BlobCropStore(CropStore):
+    """
+    Crop appended to one packed blob file, the offset and size in blob are stored
+    in Detection.frame_offset and Detection.frame_size fields.
+
+    Content is only appended, so crops of rolled back imports stay in blob as unused space.
+
+    The blob is opened and locked once per batch(), out of batch() it is opened and locked for each put().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        if getattr(self.local, 'file', None) is not None:
+            yield
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self.local.file = f
+            self.local.offset = f.seek(0, os.SEEK_END)
+            try:
+                yield
+            finally:
+                f.flush()
+                self.local.file = None
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def put(self, detection: Detection, content: bytes) -> None:
+        with self.batch():
+            offset = self.local.offset
+            self.local.file.write(content)
+            self.local.offset += len(content)
+        detection.frame_content = None
+        detection.frame_offset = offset
+        detection.frame_size = len(content)
+
+    def open(self, detection: Detection) -> Optional[BinaryIO]:
+        if detection.frame_offset is None:
+            return None
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            return io.BytesIO(os.pread(fd, detection.frame_size, detection.frame_offset))
+        finally:
+            os.close(fd)
+
+
+@lru_cache(maxsize=None)
+def get_crop_store(kind: Optional[str] = None) -> CropStore:
+    """
+    Crop store configured by CREDO_CROP_STORE and CREDO_CROP_STORE_PATH environment values.
+    :param kind: 'db', 'fs' or 'blob', default settings.CROP_STORE
+    :return: crop store
+    """
+    kind = kind or settings.CROP_STORE
+    if kind == 'fs':
+        return FileCropStore(settings.CROP_STORE_PATH)
+    if kind == 'blob':
+        return BlobCropStore(os.path.join(settings.CROP_STORE_PATH, 'crops.blob'))
+    return DbCropStore()
+
+
+def open_crop(detection: Detection) -> Optional[BinaryIO]:
+    """
+    Open content of crop of detection from the store where it was put,
+    crops imported before change of CREDO_CROP_STORE are still available.
+    :param detection: detection
+    :return: binary file object or None when detection has no crop
+    """
+    if detection.frame_content is not None:
+        return get_crop_store('db').open(detection)
+    if detection.frame_offset is not None:
+        return get_crop_store('blob').open(detection)
+    if detection.has_image:
+        return get_crop_store('fs').open(detection)
+    return None
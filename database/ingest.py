@@ -0,0 +1,154 @@
+import io
+import math
+from typing import Any, Iterable, List, Optional, Type
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Model, BinaryField, F
+
+COPY_BATCH_SIZE = 10000
+
+
+def copy_encode(v: Any) -> str:
+    """
+    Encode value to the text format of PostgreSQL COPY.
+    :param v: value prepared for DB
+    :return: encoded value
+    """
+    if v is None:
+        return '\\N'
+    if isinstance(v, bool):
+        return 't' if v else 'f'
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(v).hex()
+    if isinstance(v, float):
+        if math.isnan(v):
+            return 'NaN'
+        if math.isinf(v):
+            return 'Infinity' if v > 0 else '-Infinity'
+        return repr(v)
+    return str(v).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_insert(model_class: Type[Model], objs: Iterable[Model], batch_size: Optional[int] = None) -> int:
+    """
+    Insert objects to PostgreSQL by COPY ... FROM STDIN.
+
+    Objects are encoded in chunks of batch_size rows, so only one chunk is stored in memory as text.
+    The save() method and signals are not called, like in bulk_create().
+
+    :param model_class: model of objects
+    :param objs: objects to insert, may be generator
+    :param batch_size: count of rows in one COPY command, default COPY_BATCH_SIZE
+    :return: count of inserted rows
+    """
+    connection = connections[router.db_for_write(model_class)]
+    fields = model_class._meta.concrete_fields
+    sql = 'COPY %s (%s) FROM STDIN' % (
+        connection.ops.quote_name(model_class._meta.db_table),
+        ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    )
+    batch_size = batch_size or COPY_BATCH_SIZE
+
+    def flush(buff: io.StringIO) -> None:
+        buff.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buff)
+
+    count = 0
+    buff = io.StringIO()
+    for obj in objs:
+        row = []
+        for f in fields:
+            v = getattr(obj, f.attname)
+            if not isinstance(f, BinaryField):
+                v = f.get_db_prep_save(v, connection)
+            row.append(copy_encode(v))
+        buff.write('\t'.join(row))
+        buff.write('\n')
+        count += 1
+        if count % batch_size == 0:
+            flush(buff)
+            buff = io.StringIO()
+
+    if count % batch_size:
+        flush(buff)
+    return count
+
+
+def ingest(model_class: Type[Model], objs: List[Model], batch_size: Optional[int] = None, backend: Optional[str] = None) -> int:
+    """
+    Bulk insert of new objects.
+
+    By default bulk_create() is used. COPY by copy_insert() is used only when it is enabled explicitly,
+    by backend 'copy' (i.e. CREDO_INGEST_BACKEND=copy) and DB is PostgreSQL.
+
+    :param model_class: model of objects
+    :param objs: objects to insert
+    :param batch_size: count of rows in one query
+    :param backend: 'copy' or 'orm', default settings.INGEST_BACKEND
+    :return: count of inserted rows
+    """
+    backend = backend or settings.INGEST_BACKEND
+    connection = connections[router.db_for_write(model_class)]
+    if backend == 'copy' and connection.vendor == 'postgresql':
+        return copy_insert(model_class, objs, batch_size)
+
+    if batch_size:
+        # bulk_create() in Django 3.0 not limit batch_size to max supported by DB, i.e. 500 rows on SQLite
+        batch_size = min(batch_size, max(connection.ops.bulk_batch_size(model_class._meta.concrete_fields, objs), 1))
+    model_class.objects.bulk_create(objs, batch_size=batch_size)
+    return len(objs)
+
+
+def upsert(model_class: Type[Model], objs: List[Model], unique_fields: List[str], update_fields: List[str], add_fields: Optional[List[str]] = None) -> None:
+    """
+    Insert objects or update update_fields of existing rows with the same unique_fields.
+
+    On PostgreSQL and SQLite rows are written by INSERT ... ON CONFLICT (unique_fields) DO UPDATE
+    in chunks (one statement for up to hundreds rows), on other engines get_or_create() is used for each object.
+    The objects must be unique by unique_fields. The save() method and signals are not called.
+
+    :param model_class: model of objects
+    :param objs: objects to insert or update
+    :param unique_fields: field names of unique constraint
+    :param update_fields: field names replaced by value from object when row exists
+    :param add_fields: field names increased by value from object when row exists
+    """
+    if not len(objs):
+        return
+
+    add_fields = add_fields or []
+    connection = connections[router.db_for_write(model_class)]
+    meta = model_class._meta
+    if connection.vendor not in ['postgresql', 'sqlite']:
+        for obj in objs:
+            o, created = model_class.objects.get_or_create(
+                defaults={f.attname: getattr(obj, f.attname) for f in meta.concrete_fields if not f.auto_created},
+                **{meta.get_field(f).attname: getattr(obj, meta.get_field(f).attname) for f in unique_fields}
+            )
+            if not created:
+                updates = {meta.get_field(f).attname: getattr(obj, meta.get_field(f).attname) for f in update_fields}
+                updates.update({f: F(f) + getattr(obj, f) for f in add_fields})
+                model_class.objects.filter(pk=o.pk).update(**updates)
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    fields = [f for f in meta.concrete_fields if not f.auto_created]
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    sets = ['%s = EXCLUDED.%s' % (qn(meta.get_field(f).column), qn(meta.get_field(f).column)) for f in update_fields]
+    sets += ['%s = %s.%s + EXCLUDED.%s' % (qn(meta.get_field(f).column), table, qn(meta.get_field(f).column), qn(meta.get_field(f).column)) for f in add_fields]
+    sql = 'INSERT INTO %s (%s) VALUES %%s ON CONFLICT (%s) DO %s' % (
+        table,
+        ', '.join(qn(f.column) for f in fields),
+        ', '.join(qn(meta.get_field(f).column) for f in unique_fields),
+        'UPDATE SET %s' % ', '.join(sets) if len(sets) else 'NOTHING'
+    )
+    row = '(%s)' % ', '.join(['%s'] * len(fields))
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(objs), batch_size):
+            chunk = objs[i:i + batch_size]
+            params = [f.get_db_prep_save(f.pre_save(obj, True), connection) for obj in chunk for f in fields]
+            cursor.execute(sql % ', '.join([row] * len(chunk)), params)
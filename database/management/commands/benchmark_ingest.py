@@ -0,0 +1,88 @@
+import os
+import time
+from random import randrange
+from typing import List
+
+from django.core.management import BaseCommand
+from django.db import transaction, connection
+
+from database.ingest import ingest
+from database.models import Team, Device, CredoUser, Detection, Ping
+
+BENCHMARK_ID = 2000000000  # id of team, user and device created for benchmark, far from imported ids
+
+
+def make_pings(count: int) -> List[Ping]:
+    return [Ping(
+        id=BENCHMARK_ID + i,
+        timestamp=1577836800000 + i,
+        time_received=1577836800000 + i,
+        delta_time=i % 1000,
+        on_time=1000,
+        metadata='{"benchmark": true}',
+        device_id=BENCHMARK_ID,
+        user_id=BENCHMARK_ID
+    ) for i in range(count)]
+
+
+def make_detections(count: int, image_size: int) -> List[Detection]:
+    return [Detection(
+        id=BENCHMARK_ID + i,
+        device_id=BENCHMARK_ID,
+        user_id=BENCHMARK_ID,
+        team_id=BENCHMARK_ID,
+        timestamp=1577836800000 + i,
+        time_received=1577836800000 + i,
+        source='benchmark',
+        provider='benchmark',
+        metadata='{"benchmark":\ttrue}\n',
+        frame_content=os.urandom(image_size),
+        width=1920,
+        height=1080,
+        x=i % 1920,
+        y=i % 1080,
+        latitude=50.0,
+        longitude=20.0,
+        altitude=None,
+        accuracy=float('nan'),
+        has_image=True,
+        mime='image/png',
+        detection_width=60,
+        detection_height=60,
+        detection_inner=True,
+        random=randrange(-2147483648, 2147483647)
+    ) for i in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Compare time of insert of pings and detections by COPY and by bulk_create, all inserted rows are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--count', type=int, help='count of rows inserted in each test', default=10000)
+        parser.add_argument('--image-size', type=int, help='size of frame_content in bytes', default=2048)
+        parser.add_argument('--batch-size', type=int, help='count of rows in one query', default=1000)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        batch_size = options['batch_size']
+        print('DB engine: %s' % connection.vendor)
+
+        for name, model_class, factory in [
+            ('pings', Ping, lambda: make_pings(count)),
+            ('detections', Detection, lambda: make_detections(count, options['image_size']))
+        ]:
+            for backend in ['orm', 'copy']:
+                objs = factory()
+                with transaction.atomic():
+                    team = Team.objects.create(id=BENCHMARK_ID, name='benchmark-%d' % BENCHMARK_ID)
+                    user = CredoUser.objects.create(id=BENCHMARK_ID, username='benchmark', display_name='benchmark')
+                    Device.objects.create(id=BENCHMARK_ID, device_model='benchmark', system_version='benchmark', user=user)
+
+                    start = time.time()
+                    inserted = ingest(model_class, objs, batch_size, backend)
+                    elapsed = time.time() - start
+
+                    stored = model_class.objects.filter(device_id=BENCHMARK_ID).count()
+                    transaction.set_rollback(True)
+
+                print('%s by %s: %d rows in %.3f s (%.0f rows/s), stored: %d' % (name, backend, inserted, elapsed, inserted / max(elapsed, 1e-9), stored))
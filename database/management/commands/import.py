@@ -1,16 +1,22 @@
+from functools import partial
 from random import randrange
 from sys import stdin
-from typing import List, Tuple
+from tempfile import TemporaryDirectory
+from typing import List, Tuple, TextIO, Optional
 
 from django.core.management import BaseCommand
 from django.db import transaction
 
+from database.crop_store import get_crop_store
+from database.ingest import ingest
 from database.models import Team, Device, CredoUser, Detection
 from hit_analysis.batch.load_detections import analyse_detections_batch
 from hit_analysis.commons.config import Config
-from hit_analysis.commons.consts import CLASS_ARTIFACT
-from hit_analysis.image.image_utils import detection_load_parser
-from hit_analysis.io.load_write import load_objects_from_stream
+from hit_analysis.commons.consts import CLASS_ARTIFACT, DEVICE_ID, FRAME_CONTENT
+from hit_analysis.image.image_utils import detection_load_parser, release_images
+from hit_analysis.io.image_cache import ImageCache
+from hit_analysis.io.load_write import load_objects_from_stream, iter_json_from_stream
+from hit_analysis.io.partition import partition_objects, load_partition
 
 
 import_options = {
@@ -63,48 +69,91 @@ def sync_db(objects: List[dict], options: dict) -> Tuple[int, int, int]:
     return len(to_insert), len(to_update), not_changed
 
 
-def insert_detections(objects: List[dict]) -> int:
+def insert_detections(objects: List[dict], batch_size: Optional[int] = None, backend: Optional[str] = None) -> int:
     to_insert = []
-
-    for o in objects:
-        d = Detection()
-        for f in [
-            'id',
-            'device_id',
-            'user_id',
-            'team_id',
-            'timestamp',
-            'time_received',
-            'source',
-            'provider',
-            'metadata',
-
-            'width',
-            'height',
-
-            'x',
-            'y',
-            'latitude',
-            'longitude',
-            'altitude',
-            'accuracy',
-        ]:
-            setattr(d, f, o.get(f))
-
-        d.has_image = o.get('image') is not None
-        if d.has_image:
-            d.frame_content = o.get('frame_decoded')
-            d.detection_width, d.detection_height = o.get('image').size
-            d.mime = 'image/png'  # TODO: get from frame_content header
-            d.detection_inner = d.detection_width == d.detection_inner
-            d.ml_class = 4 if o.get('classified') == CLASS_ARTIFACT else 0
-            d.ml_hot_pixel = 5 if o.get('artifact_hot_pixel') > 1 else 1
-        d.random = randrange(-2147483648, 2147483647)
-
-        to_insert.append(d)
-
-    Detection.objects.bulk_create(to_insert)
-    return len(to_insert)
+    store = get_crop_store()
+
+    with store.batch():
+        for o in objects:
+            d = Detection()
+            for f in [
+                'id',
+                'device_id',
+                'user_id',
+                'team_id',
+                'timestamp',
+                'time_received',
+                'source',
+                'provider',
+                'metadata',
+
+                'width',
+                'height',
+
+                'x',
+                'y',
+                'latitude',
+                'longitude',
+                'altitude',
+                'accuracy',
+            ]:
+                setattr(d, f, o.get(f))
+
+            d.has_image = o.get('image') is not None
+            if d.has_image:
+                d.detection_width, d.detection_height = o.get('image').size
+                d.mime = 'image/png'  # TODO: get from frame_content header
+                store.put(d, o.get('frame_decoded'))
+                d.detection_inner = d.detection_width == d.detection_inner
+                d.ml_class = 4 if o.get('classified') == CLASS_ARTIFACT else 0
+                d.ml_hot_pixel = 5 if o.get('artifact_hot_pixel') > 1 else 1
+            d.random = randrange(-2147483648, 2147483647)
+
+            to_insert.append(d)
+
+    return ingest(Detection, to_insert, batch_size, backend)
+
+
+def stream_detection_load_parser(detection: dict, cache: Optional[ImageCache] = None) -> bool:
+    """
+    The detection_load_parser() with remove of frame_content after decode for memory free.
+    """
+    if not detection_load_parser(detection, cache):
+        return False
+    detection.pop(FRAME_CONTENT)
+    return True
+
+
+def import_detections_by_device(inp: TextIO, config: Config, chunk_size: int, workers: int = 1, cache: Optional[ImageCache] = None,
+                                 backend: Optional[str] = None) -> int:
+    """
+    Import detections from JSON stream partitioned by device_id.
+
+    Input is split to temporary files by device_id at first. Then detections of each device
+    are loaded, analysed and inserted in chunks, after that images are released.
+    So in memory are detections of only one device (or ``workers`` devices) at once.
+    :param inp: input text stream with JSON content
+    :param config: config object
+    :param chunk_size: count of detections inserted in one query
+    :param workers: count of processes, so count of devices analysed at once
+    :param cache: optional cache of decoded images
+    :param backend: backend of insertion, see: ingest()
+    :return: count of inserted detections
+    """
+    inserted = 0
+    with TemporaryDirectory() as tmp_dir:
+        timing = config.print_log('Partition detections by device_id...')
+        partitions = partition_objects(iter_json_from_stream(inp), lambda x: x.get(DEVICE_ID), tmp_dir)
+        config.print_log('... partition to %d devices done' % len(partitions), timing)
+
+        paths = list(partitions.values())
+        for i in range(0, len(paths), workers):
+            objects = [o for path in paths[i:i + workers] for o in load_partition(path) if stream_detection_load_parser(o, cache)]
+            analyse_detections_batch(objects, config, workers)
+            for j in range(0, len(objects), chunk_size):
+                inserted += insert_detections(objects[j:j + chunk_size], backend=backend)
+            release_images(objects)
+    return inserted
 
 
 class Command(BaseCommand):
@@ -114,11 +163,21 @@ class Command(BaseCommand):
         parser.add_argument('-d', '--datatype', help='data to import from input: users, devices, teams, hits or pings')
         parser.add_argument('-o', '--out-dir', help='path to store debug data. For hits: png files accepterd, rejected and suspicious (but inserted)', default='')
         parser.add_argument('-i', '--input-file', help='input JSON file, default: stdin', default='-')
+        parser.add_argument('--stream', action='store_true', help='hits only: process and insert detections one device at once, for input larger than memory')
+        parser.add_argument('--chunk-size', type=int, help='count of detections inserted in one query', default=1000)
+        parser.add_argument('--workers', type=int, help='hits only: count of processes for analysis of hits grouped by device_id', default=1)
+        parser.add_argument('--image-cache', help='hits only: directory for cache of decoded images, reused by next imports of the same input')
+        parser.add_argument('--image-cache-size', type=int, help='max size of cache of decoded images in MB', default=1024)
+        parser.add_argument('--ingest-backend', choices=['orm', 'copy'], help='hits only: orm - bulk_create, copy - COPY FROM STDIN on PostgreSQL, default: INGEST_BACKEND setting')
 
     def handle(self, *args, **options):
         datatype = options['datatype']
         out_dir = options['out_dir']
         input_file = options['input_file']
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        backend = options['ingest_backend']
+        cache = ImageCache(options['image_cache'], options['image_cache_size'] * 1024 * 1024) if options['image_cache'] else None
 
         if datatype != 'hits':
             print('Other datatypes than hits is not supported yet')
@@ -126,10 +185,13 @@ class Command(BaseCommand):
         config = Config(out_dir)
         inp = stdin if input_file == '-' else open(input_file, 'r')
 
-        if datatype == 'hits':
-            objects = load_objects_from_stream(inp, config, detection_load_parser)
-            analyse_detections_batch(objects, config)
-            inserted = insert_detections(objects)
+        if datatype == 'hits' and options['stream']:
+            inserted = import_detections_by_device(inp, config, chunk_size, workers, cache, backend)
+            print('Inserted %d detections' % inserted)
+        elif datatype == 'hits':
+            objects = load_objects_from_stream(inp, config, partial(detection_load_parser, cache=cache))
+            analyse_detections_batch(objects, config, workers)
+            inserted = insert_detections(objects, chunk_size, backend)
             print('Inserted %d detections' % inserted)
         elif datatype in import_options.keys():
             objects = load_objects_from_stream(inp, config)
@@ -0,0 +1,38 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from database.crop_store import get_crop_store, DbCropStore
+from database.models import Detection
+
+
+class Command(BaseCommand):
+    help = 'Move crops stored in Detection.frame_content to crop store configured by CREDO_CROP_STORE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='count of detections moved in one transaction', default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        store = get_crop_store()
+        if isinstance(store, DbCropStore):
+            print('Crop store is DB, please set CREDO_CROP_STORE to fs or blob')
+            return
+
+        moved = 0
+        last_id = None
+        while True:
+            qs = Detection.objects.exclude(frame_content=None).order_by('id')
+            if last_id is not None:
+                qs = qs.filter(id__gt=last_id)
+            chunk = list(qs.only('id', 'mime', 'frame_content')[:chunk_size])
+            if not len(chunk):
+                break
+
+            with transaction.atomic(), store.batch():
+                for d in chunk:
+                    store.put(d, bytes(d.frame_content))
+                Detection.objects.bulk_update(chunk, ['frame_content', 'frame_offset', 'frame_size'])
+
+            moved += len(chunk)
+            last_id = chunk[-1].id
+            print('Moved %d crops' % moved)
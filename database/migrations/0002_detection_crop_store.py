@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detection',
+            name='frame_offset',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='detection',
+            name='frame_size',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='detection',
+            name='ml_class',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='detection',
+            name='ml_hot_pixel',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -65,7 +65,7 @@ class Detection(models.Model):  # TODO: use Detection object for store data from
     CREDO Detection imported from original CREDO Database.
 
     The id, device, user, team, timestamp, time_received and metadata fields are imported from detections/*.json.
-    The frame_content was decoded and stored in file system.
+    The frame_content was decoded and stored by crop store (see database.crop_store), in DB or in file system.
     Reset attributes are stored in DetectionAttribute.
     """
 
@@ -80,7 +80,9 @@ class Detection(models.Model):  # TODO: use Detection object for store data from
     provider = models.CharField(max_length=255, blank=True)  # TODO: comment
     metadata = models.TextField(null=True, blank=True)  # additional data from Detector App
 
-    frame_content = models.BinaryField(blank=True, null=True)  # content of cropped image with cosmic-ray detection
+    frame_content = models.BinaryField(blank=True, null=True)  # content of cropped image with cosmic-ray detection, NULL when stored out of DB
+    frame_offset = models.BigIntegerField(blank=True, null=True)  # offset of frame_content in packed blob file of crop store
+    frame_size = models.IntegerField(blank=True, null=True)  # size of frame_content in packed blob file of crop store
     width = models.IntegerField(blank=True, null=True)  # width of whole image frame
     height = models.IntegerField(blank=True, null=True)  # height of whole image frame
 
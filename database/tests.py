@@ -1,3 +1,232 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+from tempfile import TemporaryDirectory
+from typing import List
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.db import connection
+from django.core.asgi import get_asgi_application
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from classify.models import DetectionScore
+from database.crop_store import BlobCropStore, FileCropStore
+from database.ingest import upsert
+from database.models import Team, CredoUser, Device, Detection
+from definitions.models import Attribute
+from users.models import User, Token
+from values.models import DetectionConsensus
+
+
+EXPORT_URL = '/' + settings.BASE_URL + 'api/export/detections/'
+
+
+def create_detections(n: int, **fields) -> List[Detection]:
+    """
+    Create detections with IDs from 1 to n, all of the same team, user and device with ID 1.
+    :param n: count of detections
+    :param fields: values of fields for all detections, override the defaults
+    :return: created detections
+    """
+    team = Team.objects.create(id=1, name='team')
+    credo_user = CredoUser.objects.create(id=1, username='u', display_name='u')
+    device = Device.objects.create(id=1, device_model='m', system_version='1', user=credo_user)
+    common = dict(device=device, user=credo_user, team=team, has_image=True, score=0)
+    return Detection.objects.bulk_create([
+        Detection(**{'id': i, 'timestamp': i, 'time_received': i, **common, **fields}) for i in range(1, n + 1)
+    ])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ExportDetectionsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        create_detections(25)
+        spot = Attribute.objects.create(name='spot', author=cls.admin, active=True, kind='c')
+        DetectionScore.objects.create(user=cls.admin, detection_id=3, kind='c', score=1, verified=True)
+        DetectionConsensus.objects.create(detection_id=3, attribute=spot, votes=2, total=3, total_sq=5, mean=1.5, variance=0.25, weighted=1.5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def read(self, params: str):
+        response = self.client.get(EXPORT_URL + params)
+        self.assertEqual(response.status_code, 200)
+        return response, response.content.decode()
+
+    def test_ndjson_pages_by_after(self):
+        response, content = self.read('?chunk_size=4&limit=10')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([r['id'] for r in rows], list(range(1, 11)))
+        self.assertEqual(response['X-Next-After'], '10')
+        self.assertEqual(rows[2]['scores_count'], 1)
+        self.assertEqual(rows[2]['verified_count'], 1)
+        self.assertEqual(rows[2]['attributes']['spot']['mean'], 1.5)
+
+        response, content = self.read('?chunk_size=4&limit=10&after=20')
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], list(range(21, 26)))
+        self.assertFalse(response.has_header('X-Next-After'))
+
+    def test_csv(self):
+        response, content = self.read('?output=csv&after=2&limit=1')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], '3')
+        self.assertEqual(rows[0]['spot_votes'], '2')
+        self.assertEqual(rows[0]['spot_weighted'], '1.5')
+
+    def test_invalid_params(self):
+        for params in ['?after=a', '?after=-1', '?limit=0', '?chunk_size=1.5', '?user=x', '?output=xml']:
+            self.assertEqual(self.client.get(EXPORT_URL + params).status_code, 400, params)
+
+    def test_asgi(self):
+        """
+        The ASGI handler sends the response in event loop, where the ORM raises SynchronousOnlyOperation.
+        """
+        key = Token.objects.create(user=self.admin).key
+        communicator = ApplicationCommunicator(get_asgi_application(), {
+            'type': 'http', 'method': 'GET', 'path': EXPORT_URL, 'query_string': b'chunk_size=2',
+            'headers': [(b'authorization', ('Token %s' % key).encode())],
+        })
+
+        async def run():
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(5)
+            body = b''
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    return start, body
+
+        start, body = async_to_sync(run)()
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(len(body.decode().splitlines()), 25)
+
+
+class CropStoreTest(TestCase):
+    def check_store(self, store):
+        detections = [Detection(id=i, mime='image/png', has_image=True) for i in range(1, 5)]
+        with store.batch():
+            for d in detections[:3]:
+                store.put(d, b'crop %d' % d.id)
+        store.put(detections[3], b'crop 4')
+
+        for d in detections:
+            self.assertIsNone(d.frame_content)
+            self.assertEqual(store.read(d), b'crop %d' % d.id)
+
+    def test_blob(self):
+        with TemporaryDirectory() as tmp_dir:
+            self.check_store(BlobCropStore(os.path.join(tmp_dir, 'crops.blob')))
+
+    def test_file(self):
+        with TemporaryDirectory() as tmp_dir:
+            self.check_store(FileCropStore(tmp_dir))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ServeImageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_detections(2, mime='image/png', frame_content=b'crop')
+        Detection.objects.filter(id=2).update(has_image=False, mime=None, frame_content=None)
+
+    def get(self, detection_id: int, if_none_match: str):
+        return self.client.get('/%simages/%d.png' % (settings.BASE_URL, detection_id), HTTP_IF_NONE_MATCH=if_none_match)
+
+    def test_not_modified(self):
+        for if_none_match in ['"detection-1"', '"other", W/"detection-1"', '*']:
+            response = self.get(1, if_none_match)
+            self.assertEqual(response.status_code, 304, if_none_match)
+            self.assertEqual(response['ETag'], '"detection-1"')
+            self.assertIn('immutable', response['Cache-Control'])
+
+    def test_modified(self):
+        for if_none_match in ['', '"other"', '"detection-11"']:
+            response = self.get(1, if_none_match)
+            self.assertEqual(response.status_code, 200, if_none_match)
+            self.assertEqual(b''.join(response.streaming_content), b'crop')
+
+    def test_not_exists(self):
+        for detection_id in [2, 3]:
+            for if_none_match in ['"detection-%d"' % detection_id, '*']:
+                self.assertEqual(self.get(detection_id, if_none_match).status_code, 404)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ServeSpriteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_detections(2, mime='image/png')
+        for i, size in [(1, (3, 2)), (2, (4, 5))]:
+            buff = io.BytesIO()
+            Image.new('RGBA', size, (i, 0, 0, 255)).save(buff, format='PNG')
+            Detection.objects.filter(id=i).update(frame_content=buff.getvalue())
+
+    def get(self, ids: str):
+        return self.client.get('/%simages/sprite/?ids=%s' % (settings.BASE_URL, ids))
+
+    def test_full(self):
+        response = self.get('2,1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        data = response.json()
+        self.assertEqual(data['coords'], {
+            '2': {'x': 0, 'y': 0, 'width': 4, 'height': 5},
+            '1': {'x': 4, 'y': 0, 'width': 3, 'height': 2},
+        })
+        sprite = Image.open(io.BytesIO(base64.b64decode(data['image'].split(',', 1)[1])))
+        self.assertEqual(sprite.getpixel((4, 0)), (1, 0, 0, 255))
+
+    def test_partial(self):
+        response = self.get('1,3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['coords'].keys()), ['1'])
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+    def test_bad_request(self):
+        self.assertEqual(self.get('').status_code, 400)
+        self.assertEqual(self.get('1,a').status_code, 400)
+
+
+class UpsertTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.spot = Attribute.objects.create(name='spot', author=cls.author, kind='c')
+        create_detections(300)
+
+    def check_upsert(self):
+        # more rows than one statement of SQLite may contain
+        upsert(DetectionConsensus, [
+            DetectionConsensus(detection_id=i, attribute=self.spot, votes=1, total=i, mean=i) for i in range(1, 201)
+        ], ['detection', 'attribute'], ['mean'], ['votes', 'total'])
+        upsert(DetectionConsensus, [
+            DetectionConsensus(detection_id=i, attribute=self.spot, votes=1, total=1, mean=-i) for i in range(101, 301)
+        ], ['detection', 'attribute'], ['mean'], ['votes', 'total'])
+        upsert(DetectionConsensus, [
+            DetectionConsensus(detection_id=i, attribute=self.spot, votes=5) for i in [1, 300]
+        ], ['detection', 'attribute'], [])
+
+        rows = {d: (v, t, m) for d, v, t, m in DetectionConsensus.objects.values_list('detection_id', 'votes', 'total', 'mean')}
+        self.assertEqual(len(rows), 300)
+        self.assertEqual(rows[1], (1, 1, 1))
+        self.assertEqual(rows[150], (2, 151, -150))
+        self.assertEqual(rows[300], (1, 1, -300))
+
+    def test_on_conflict(self):
+        self.check_upsert()
+
+    def test_other_engines(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.check_upsert()
@@ -1,21 +1,78 @@
 import base64
+import codecs
+import csv
 import io
+import json
+import math
+from contextlib import ExitStack
 from random import randrange
-from typing import Any, Optional, List
+from typing import Any, Optional, List, Dict, Iterable, Iterator, Tuple
 from PIL import Image
 
-from django.db.models import Model
-from django.http import HttpResponse
+from django.db.models import Model, QuerySet, Count, Sum, Q
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag, parse_etags
 from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.status import HTTP_410_GONE
 from rest_framework.views import APIView
 
+from classify.models import DetectionScore
+from database.crop_store import get_crop_store, open_crop
+from database.ingest import ingest
 from database.models import Team, CredoUser, Device, Ping, Detection
 from database.serializers import TeamsFileSerializer, CredoUsersFileSerializer, DevicesFileSerializer, PingFileSerializer, DetectionFileSerializer
+from definitions.cache import get_attributes
 from definitions.models import Attribute
-from values.models import DetectionAttribute
+from hit_analysis.io.load_write import iter_json_from_stream
+from values.models import DetectionAttribute, DetectionConsensus
+
+
+IMAGE_FIELDS = ['id', 'mime', 'has_image', 'frame_content', 'frame_offset', 'frame_size']  # fields used by serve_image()
+IMAGE_MAX_AGE = 60 * 60 * 24 * 365  # crops are immutable, so may be cached by one year
+SPRITE_MAX_COUNT = 100  # max count of crops in one sprite, the same as max count of detections in classification queue
+
+
+def get_int_param(request, name: str, default: Optional[int] = None, min_value: int = 0) -> Optional[int]:
+    """
+    Integer query param of request.
+    :param request: DRF request
+    :param name: name of param
+    :param default: value when param is not provided
+    :param min_value: min valid value
+    :return: value of param
+    :raise ValidationError: when value is not integer or is less than min_value, so the response is HTTP 400
+    """
+    value = request.query_params.get(name, '')
+    if value == '':
+        return default
+    try:
+        ret = int(value)
+    except ValueError:
+        raise ValidationError({name: 'must be integer'})
+    if ret < min_value:
+        raise ValidationError({name: 'must be greater than or equal to %d' % min_value})
+    return ret
+
+
+def iter_batches(units: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """
+    Split units to lists of at most size units.
+    :param units: iterable of units, i.e. list or generator
+    :param size: max count of units in one list
+    :return: iterator over lists of units
+    """
+    batch = []
+    for unit in units:
+        batch.append(unit)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch):
+        yield batch
 
 
 def default_to(v: Any, d: Any) -> Any:
@@ -31,23 +88,40 @@ class GenericImporter(APIView):
     unit_name = None  # field with array of imported data
     model_class = None
     fields_to_import = []  # field names list to be imported except 'id'
+    batch_size = 1000  # count of rows fetched, inserted or updated at once
 
     permission_classes = [permissions.IsAdminUser]
 
     def nocheck_exists(self, request) -> bool:
         return bool(request.query_params.get('nocheck'))
 
+    def stream_exists(self, request) -> bool:
+        return bool(request.query_params.get('stream'))
+
+    def batch_context(self):
+        """
+        Context of post_import() calls for one batch.
+        """
+        return ExitStack()  # no-op context manager, nullcontext() is not available on Python 3.6
+
     def post(self, request, *args, **kwargs):
         """
         Import fields_to_import values parsed by serializer_class from unit_name array to model_class model.
 
         Performance optimizations:
-        - bulk insertion for new rows
+        - bulk insertion for new rows, by COPY on PostgreSQL when enabled by INGEST_BACKEND setting (see ingest())
+        - existing rows are fetched by one query per batch_size rows and changed rows are updated by bulk update
         - if /?nocheck=1 then no checked existing row
+        - if /?stream=1 then units are parsed and validated one by one from request body
+          and written every batch_size rows, so whole file is never stored in memory
         - attrbulk for bulk insertion of attributes (can't use private field)
         """
-        serializer = self.serializer_class(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        if self.stream_exists(request):
+            units = self.iter_stream_units(request)
+        else:
+            serializer = self.serializer_class(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            units = serializer.validated_data.get(self.unit_name, [])
 
         parsed = 0
         inserted = 0
@@ -55,50 +129,56 @@ class GenericImporter(APIView):
         not_changed = 0
 
         check = not self.nocheck_exists(request)
-        bulk = []
         first = True
 
-        for unit in serializer.validated_data.get(self.unit_name, []):
-            parsed += 1
-            v_id = unit.get('id')
+        for batch in iter_batches(units, self.batch_size):
 
             # quick test: when nocheck then check if first in DB and when it then raise error
-            if not check and first:
-                v = self.model_class.objects.filter(pk=v_id).first()
-                if v is not None:
-                    return Response({
-                        'parsed': 0,
-                        'inserted': 0,
-                        'updated': 0,
-                        'not_changed': 0
-                    }, status=HTTP_410_GONE)
+            if not check and first and self.model_class.objects.filter(pk=batch[0].get('id')).exists():
+                return Response({
+                    'parsed': 0,
+                    'inserted': 0,
+                    'updated': 0,
+                    'not_changed': 0
+                }, status=HTTP_410_GONE)
             first = False
 
-            v_fields = {}
-            for f in self.fields_to_import:
-                v_fields[f] = unit.get(f)
-
-            v = self.model_class.objects.filter(pk=v_id).first() if check else None  # type: Optional[Model]
-            if v is None:
-                inserted += 1
-                e = self.model_class(id=v_id, **v_fields)
-                self.post_import(e, unit)
-                bulk.append(e)
-            else:
-                changed = False
-                for key, value in v_fields.items():
-                    if getattr(v, key) != value:
-                        changed = True
-                        setattr(v, key, value)
-
-                if changed:
-                    v.save()
-                    updated += 1
-                else:
-                    not_changed += 1
-
-        if len(bulk):
-            self.model_class.objects.bulk_create(bulk)
+            bulk = []
+            to_update = []
+            in_db = self.model_class.objects.in_bulk([unit.get('id') for unit in batch]) if check else {}  # type: Dict[int, Model]
+
+            with self.batch_context():
+                for unit in batch:
+                    parsed += 1
+                    v_id = unit.get('id')
+
+                    v_fields = {}
+                    for f in self.fields_to_import:
+                        v_fields[f] = unit.get(f)
+
+                    v = in_db.get(v_id)  # type: Optional[Model]
+                    if v is None:
+                        inserted += 1
+                        e = self.model_class(id=v_id, **v_fields)
+                        self.post_import(e, unit)
+                        bulk.append(e)
+                    else:
+                        changed = False
+                        for key, value in v_fields.items():
+                            if getattr(v, key) != value:
+                                changed = True
+                                setattr(v, key, value)
+
+                        if changed:
+                            to_update.append(v)
+                            updated += 1
+                        else:
+                            not_changed += 1
+
+            if len(to_update):
+                self.model_class.objects.bulk_update(to_update, self.fields_to_import)
+            if len(bulk):
+                ingest(self.model_class, bulk)
 
         return Response({
             'parsed': parsed,
@@ -107,6 +187,27 @@ class GenericImporter(APIView):
             'not_changed': not_changed
         })
 
+    def iter_stream_units(self, request) -> Iterator[dict]:
+        """
+        Parse and validate units from unit_name array in request body one by one.
+
+        The body is read in chunks directly from request stream by ``iter_json_from_stream()``
+        and each unit is validated by child serializer of unit_name field of serializer_class.
+
+        :param request: request with JSON content as body
+        :return: iterator over validated units
+        """
+        child = self.serializer_class().fields[self.unit_name].child
+        stream = request.stream
+        if stream is None:
+            return
+
+        for i, obj in enumerate(iter_json_from_stream(codecs.getreader('utf-8')(stream))):
+            try:
+                yield child.run_validation(obj)
+            except ValidationError as e:
+                raise ValidationError({self.unit_name: {i: e.detail}})
+
     def post_import(self, entity, source):
         pass
 
@@ -145,16 +246,20 @@ class ImportDetections(GenericImporter):
     model_class = Detection
     fields_to_import = ['timestamp', 'time_received', 'device_id', 'user_id', 'team_id', 'source', 'provider', 'metadata', 'accuracy', 'latitude', 'longitude', 'altitude', 'height', 'width', 'x', 'y']
 
+    def batch_context(self):
+        return get_crop_store().batch()
+
     def post_import(self, entity: Detection, source):
         frame_content = source.get('frame_content')
         if frame_content:
             entity.has_image = True
             try:
-                entity.frame_content = base64.decodebytes(str.encode(frame_content))
-                image = Image.open(io.BytesIO(entity.frame_content))
+                content = base64.decodebytes(str.encode(frame_content))
+                image = Image.open(io.BytesIO(content))
                 entity.mime = 'image/png'
                 entity.detection_width, entity.detection_height = image.size
                 entity.random = randrange(-2147483648, 2147483647)
+                get_crop_store().put(entity, content)
             except:
                 entity.frame_content = None
                 entity.mime = None
@@ -164,9 +269,235 @@ class ImportDetections(GenericImporter):
             entity.has_image = False
 
 
+def if_none_match(request, etag: str) -> bool:
+    """
+    Check the If-None-Match header of request by weak comparison, see RFC 7232 section 3.2.
+    :param request: HTTP request
+    :param etag: strong ETag of current representation of resource
+    :return: True when client has current representation and may be answered by 304
+    """
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in etags or etag in [e[2:] if e.startswith('W/') else e for e in etags]
+
+
 def serve_image(request, detection_id, *args, **kwargs):
-    detection = get_object_or_404(Detection, pk=detection_id)
-    return HttpResponse(detection.frame_content, content_type=detection.mime)
+    """
+    Serve content of crop of detection.
+
+    The crop is immutable after import, so the strong ETag is made from detection ID
+    and the client which has it responds by If-None-Match is answered by 304 when the crop still exists
+    (checked by one light query without loading of crop content).
+    """
+    detection_id = int(detection_id)
+    etag = quote_etag('detection-%d' % detection_id)
+    if if_none_match(request, etag) and Detection.objects.filter(pk=detection_id, has_image=True).exists():
+        response = HttpResponseNotModified()
+    else:
+        detection = get_object_or_404(Detection.objects.only(*IMAGE_FIELDS), pk=detection_id)
+        f = open_crop(detection)
+        if f is None:
+            raise Http404()
+        response = FileResponse(f, content_type=detection.mime)
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=IMAGE_MAX_AGE, immutable=True)
+    return response
+
+
+def make_sprite(detections: List[Detection]) -> Tuple[Optional[Image.Image], Dict[int, dict]]:
+    """
+    Paste crops of detections to one image in grid with cells of size of the largest crop.
+    :param detections: detections with fields from IMAGE_FIELDS
+    :return: sprite image (None when no crop) and map from detection ID to x, y, width and height of its crop in sprite
+    """
+    crops = []
+    for d in detections:
+        f = open_crop(d)
+        if f is None:
+            continue
+        try:
+            with f:
+                image = Image.open(f)
+                image.load()
+        except OSError:
+            continue
+        crops.append((d.id, image))
+
+    if not len(crops):
+        return None, {}
+
+    columns = math.ceil(math.sqrt(len(crops)))
+    rows = math.ceil(len(crops) / columns)
+    cell_w = max(image.width for _, image in crops)
+    cell_h = max(image.height for _, image in crops)
+
+    sprite = Image.new('RGBA', (columns * cell_w, rows * cell_h))
+    coords = {}
+    for i, (d_id, image) in enumerate(crops):
+        x = (i % columns) * cell_w
+        y = (i // columns) * cell_h
+        sprite.paste(image, (x, y))
+        coords[d_id] = {'x': x, 'y': y, 'width': image.width, 'height': image.height}
+    return sprite, coords
+
+
+def serve_sprite(request, *args, **kwargs):
+    """
+    Serve crops of many detections in one response, i.e. for /images/sprite/?ids=1,2,3
+
+    Response is JSON with the sprite sheet as PNG data URI in ``image`` field and map from detection ID
+    to coordinates of its crop in ``coords`` field. Detections without crop are omitted in map.
+    Up to SPRITE_MAX_COUNT detections may be requested at once.
+
+    Only the sprite with crops of all requested detections is immutable and may be cached,
+    the partial sprite (i.e. some detections are not imported yet) is not stored by caches.
+    """
+    try:
+        ids = [int(x) for x in request.GET.get('ids', '').split(',') if x.strip()]
+    except ValueError:
+        return JsonResponse({'detail': 'ids must be comma separated list of detection ID'}, status=400)
+    if not len(ids):
+        return JsonResponse({'detail': 'ids is required'}, status=400)
+    if len(ids) > SPRITE_MAX_COUNT:
+        return JsonResponse({'detail': 'max %d ids is supported' % SPRITE_MAX_COUNT}, status=400)
+
+    order = {d_id: i for i, d_id in enumerate(ids)}
+    detections = sorted(Detection.objects.only(*IMAGE_FIELDS).filter(id__in=ids), key=lambda d: order[d.id])
+    sprite, coords = make_sprite(detections)
+
+    image = None
+    if sprite is not None:
+        buff = io.BytesIO()
+        sprite.save(buff, format='PNG')
+        image = 'data:image/png;base64,' + base64.b64encode(buff.getvalue()).decode()
+
+    response = JsonResponse({'image': image, 'coords': coords})
+    if len(coords) == len(set(ids)):
+        patch_cache_control(response, public=True, max_age=IMAGE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, no_store=True)
+    return response
+
+
+class ExportDetections(APIView):
+    """
+    Export of detections with aggregates of classification results, i.e.
+    /api/export/detections/?output=csv&after=1000&user=1
+
+    Detections are read in pages of chunk_size rows by keyset pagination (id > last exported id), never by OFFSET.
+    One request exports at most limit rows, so memory usage of request is bounded for any count of rows in DB.
+    When limit is reached then the X-Next-After header contains the last exported id and the export
+    is continued by next request with after param set to this value, without the header the export is complete.
+
+    All pages are read and rendered in the view, in the transaction of request, and returned in one response.
+    The response is not streamed, because the iteration of streaming response by ASGI handler is executed
+    in event loop where the ORM is not allowed, so memory usage is bounded by limit instead.
+
+    Params:
+      * output: ndjson (default) or csv, each response of csv contains the header row
+      * after: export detections with id greater than after
+      * user, team, device: filter detections
+      * chunk_size: count of detections in one page, default 1000, max 10000
+      * limit: max count of detections in response, default 10000, max 100000
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    fields = [
+        'id', 'device_id', 'user_id', 'team_id', 'timestamp', 'time_received', 'source', 'provider',
+        'width', 'height', 'x', 'y', 'latitude', 'longitude', 'altitude', 'accuracy',
+        'has_image', 'mime', 'detection_width', 'detection_height', 'score', 'ml_class', 'ml_hot_pixel'
+    ]
+    score_fields = ['scores_count', 'scores_sum', 'verified_count']
+    consensus_fields = ['votes', 'mean', 'variance', 'weighted']
+    max_chunk_size = 10000
+    max_limit = 100000
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ['ndjson', 'csv']:
+            raise ValidationError({'output': 'must be ndjson or csv'})
+        after = get_int_param(request, 'after', 0)
+        chunk_size = min(get_int_param(request, 'chunk_size', 1000, 1), self.max_chunk_size)
+        limit = min(get_int_param(request, 'limit', 10000, 1), self.max_limit)
+
+        qs = Detection.objects.all()
+        for param in ['user', 'team', 'device']:
+            value = get_int_param(request, param)
+            if value is not None:
+                qs = qs.filter(**{'%s_id' % param: value})
+
+        attributes = sorted(a.name for a in get_attributes().values())
+        if output == 'csv':
+            chunks = [self.render_csv_header(attributes)]
+            content_type = 'text/csv'
+        else:
+            chunks = []
+            content_type = 'application/x-ndjson'
+
+        count = 0
+        last_id = after
+        for page in self.iter_pages(qs, after, chunk_size, limit):
+            chunks.append(self.render_csv(page, attributes) if output == 'csv' else self.render_ndjson(page))
+            count += len(page)
+            last_id = page[-1]['id']
+
+        response = HttpResponse(chunks, content_type=content_type)
+        if count >= limit:
+            response['X-Next-After'] = str(last_id)
+        return response
+
+    def iter_pages(self, qs: QuerySet, after: int, chunk_size: int, limit: int) -> Iterator[List[dict]]:
+        """
+        Pages of detections with scores and consensus of attributes.
+        :param qs: filtered detections
+        :param after: export detections with id greater than after
+        :param chunk_size: count of detections in one page
+        :param limit: max count of detections in all pages
+        :return: iterator over pages, the detection is dict with fields, score_fields and attributes dict
+        """
+        last_id = after
+        left = limit
+        while left > 0:
+            page = list(qs.filter(id__gt=last_id).order_by('id').values(*self.fields)[:min(chunk_size, left)])
+            if not len(page):
+                return
+
+            ids = [d['id'] for d in page]
+            scores = {s['detection_id']: s for s in DetectionScore.objects.filter(detection_id__in=ids).values('detection_id').annotate(
+                scores_count=Count('id'), scores_sum=Sum('score'), verified_count=Count('id', filter=Q(verified=True))
+            ).order_by()}
+            consensus = {}  # type: Dict[int, Dict[str, dict]]
+            for c in DetectionConsensus.objects.filter(detection_id__in=ids).values('detection_id', 'attribute__name', *self.consensus_fields):
+                consensus.setdefault(c.pop('detection_id'), {})[c.pop('attribute__name')] = c
+
+            for d in page:
+                s = scores.get(d['id'], {})
+                for f in self.score_fields:
+                    d[f] = s.get(f, 0)
+                d['attributes'] = consensus.get(d['id'], {})
+
+            yield page
+            last_id = ids[-1]
+            left -= len(page)
+
+    def render_ndjson(self, page: List[dict]) -> str:
+        return ''.join(json.dumps(d) + '\n' for d in page)
+
+    def render_csv_header(self, attributes: List[str]) -> str:
+        buff = io.StringIO()
+        csv.writer(buff).writerow(self.fields + self.score_fields + ['%s_%s' % (a, f) for a in attributes for f in self.consensus_fields])
+        return buff.getvalue()
+
+    def render_csv(self, page: List[dict], attributes: List[str]) -> str:
+        buff = io.StringIO()
+        writer = csv.writer(buff)
+        for d in page:
+            row = [d[f] for f in self.fields + self.score_fields]
+            for a in attributes:
+                c = d['attributes'].get(a, {})
+                row.extend(c.get(f, '') for f in self.consensus_fields)
+            writer.writerow(row)
+        return buff.getvalue()
 
 
 class CheckUserTeamIdView(APIView):
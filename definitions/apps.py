@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DefinitionsConfig(AppConfig):
     name = 'definitions'
+
+    def ready(self):
+        # connect signals for invalidation of cached attributes
+        import definitions.cache  # noqa: F401
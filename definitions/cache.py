@@ -0,0 +1,124 @@
+from threading import local
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from django.core.signals import request_started, request_finished
+from django.db.models.signals import post_save, post_delete
+
+from definitions.models import Attribute, Relation, DefinitionsVersion
+from definitions.serializers import AttributeSerializer
+
+_attributes = None  # type: Optional[Dict[str, Attribute]]
+_serialized = None  # type: Optional[Dict[str, dict]]
+_relations = None  # type: Optional[List[Relation]]
+_version = None  # type: Optional[str]
+_request = local()  # checked: None out of request, False when version is not checked yet in current request
+
+
+def get_version() -> str:
+    """
+    Version of attribute definitions stored in DB (see: DefinitionsVersion), so all processes
+    of server invalidate their local caches together, the check costs one primary key query.
+    :return: current version
+    """
+    return DefinitionsVersion.objects.filter(pk=1).values_list('version', flat=True).first() or ''
+
+
+def invalidate_attributes(*args, **kwargs) -> None:
+    """
+    Invalidate cached attributes and relations in all processes, connected to post_save and post_delete of Attribute and Relation.
+
+    The version is changed in the transaction of change, so other processes reload definitions after commit.
+    """
+    global _attributes
+    _attributes = None
+    version = uuid4().hex
+    if not DefinitionsVersion.objects.filter(pk=1).update(version=version):
+        DefinitionsVersion.objects.update_or_create(pk=1, defaults={'version': version})
+
+
+def start_request(*args, **kwargs) -> None:
+    """
+    Check the version once again in the request, connected to request_started.
+    """
+    _request.checked = False
+
+
+def finish_request(*args, **kwargs) -> None:
+    """
+    Check the version on each use out of request (i.e. in management commands), connected to request_finished.
+    """
+    _request.checked = None
+
+
+def load_attributes() -> None:
+    """
+    Load attributes and relations when cache is invalidated in this process or version in DB is changed.
+    The version is checked once per request or on each call out of request.
+    """
+    global _attributes, _serialized, _relations, _version
+    checked = getattr(_request, 'checked', None)
+    if _attributes is not None and checked:
+        return
+
+    version = get_version()
+    if checked is not None:
+        _request.checked = True
+    if _attributes is None or _version != version:
+        attributes = list(Attribute.objects.all())
+        _serialized = {a.name: AttributeSerializer(a).data for a in attributes}
+        _relations = list(Relation.objects.all())
+        _attributes = {a.name: a for a in attributes}
+        _version = version
+
+
+def get_attributes() -> Dict[str, Attribute]:
+    """
+    All attributes, cached in process until Attribute is changed.
+    :return: dict of attributes by name, ordered by name
+    """
+    load_attributes()
+    return _attributes
+
+
+def get_attribute(name: str) -> Attribute:
+    """
+    Cached equivalent of Attribute.objects.get(name=name).
+    :param name: name of attribute
+    :return: attribute
+    """
+    a = get_attributes().get(name)
+    if a is None:
+        raise Attribute.DoesNotExist('Attribute %s does not exist' % name)
+    return a
+
+
+def get_serialized_attributes(kind: Optional[str] = None, active: Optional[bool] = None) -> List[dict]:
+    """
+    Attributes serialized by AttributeSerializer, cached in process until Attribute is changed.
+    :param kind: filter by kind when provided, @see Attribute.kind
+    :param active: filter by active when provided
+    :return: list of serialized attributes ordered by name
+    """
+    load_attributes()
+    return [
+        _serialized[a.name] for a in _attributes.values()
+        if (kind is None or a.kind == kind) and (active is None or a.active == active)
+    ]
+
+
+def get_relations() -> List[Relation]:
+    """
+    All relations between attributes, cached in process until Attribute or Relation is changed.
+    :return: list of relations
+    """
+    load_attributes()
+    return _relations
+
+
+post_save.connect(invalidate_attributes, sender=Attribute)
+post_delete.connect(invalidate_attributes, sender=Attribute)
+post_save.connect(invalidate_attributes, sender=Relation)
+post_delete.connect(invalidate_attributes, sender=Relation)
+request_started.connect(start_request)
+request_finished.connect(finish_request)
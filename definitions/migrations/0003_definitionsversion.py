@@ -0,0 +1,25 @@
+# Generated by Django 3.0.7 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    apps.get_model('definitions', 'DefinitionsVersion').objects.create(id=1, version='initial')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('definitions', '0002_auto_20200526_1738'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefinitionsVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(default='', max_length=32)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,11 @@
+import ast
+import sys
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+import numpy as np
+from django.core.exceptions import ValidationError
 from django.db import models
-from seval import safe_eval
 from django.utils.translation import gettext_lazy as _
 
 from credo_classification.drf import DjangoPlusViewPermissionsMixin
@@ -35,11 +41,50 @@ class Attribute(models.Model):
         ordering = ['name']
 
 
+EVALUATION_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub,
+)
+if sys.version_info < (3, 8):
+    # number literals are parsed to ast.Num before Python 3.8
+    EVALUATION_NODES += (ast.Num,)
+
+
+@lru_cache(maxsize=1024)
+def compile_evaluation(evaluation: str) -> Callable[[Any], Any]:
+    """
+    Parse and validate evaluation of relation once and compile it to function of x.
+
+    Only arithmetic operators, numbers and the x variable are allowed, so the function is safe to call
+    and works for float x and for NumPy array x as well.
+
+    :param evaluation: arithmetic expression with x variable, i.e. 'x * 2'
+    :return: function of x
+    """
+    try:
+        tree = ast.parse(evaluation.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError('invalid evaluation %r: %s' % (evaluation, e.msg))
+
+    for node in ast.walk(tree):
+        if not isinstance(node, EVALUATION_NODES):
+            raise ValueError('invalid evaluation %r: unsupported %s' % (evaluation, node.__class__.__name__))
+        if isinstance(node, ast.Name) and node.id != 'x':
+            raise ValueError('invalid evaluation %r: unknown variable %s' % (evaluation, node.id))
+        if isinstance(node, ast.Constant) or sys.version_info < (3, 8) and isinstance(node, ast.Num):
+            value = node.value if isinstance(node, ast.Constant) else node.n
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError('invalid evaluation %r: unsupported constant %r' % (evaluation, value))
+
+    code = compile(tree, '<evaluation>', 'eval')
+    return lambda x: eval(code, {'__builtins__': {}}, {'x': x})
+
+
 class Relation(models.Model):
     """
     Semantic net relation between attributes.
 
-    Weight of relation is evaluated by arithmetic function executed by seval library. I.e.:
+    Weight of relation is evaluated by arithmetic function compiled once by compile_evaluation(). I.e.:
     evaluation='x * 2', where x was replaced by src attribute value
     """
     name = models.CharField(max_length=255)
@@ -50,17 +95,63 @@ class Relation(models.Model):
     dest = models.ForeignKey(Attribute, on_delete=models.PROTECT, related_name='relation_dest')
     evaluation = models.CharField(max_length=255, default='x')
 
+    _function = None  # type: Optional[Callable[[Any], Any]]
+
+    def get_function(self) -> Callable[[Any], Any]:
+        """
+        Compiled evaluation, memoized until the relation is saved.
+        """
+        if self._function is None:
+            self._function = compile_evaluation(self.evaluation)
+        return self._function
+
     def evaluate_weight(self, src_value: float) -> float:
         """
-        Evaluate weight of relation.
+        Evaluate weight of relation, the same way as evaluate_weights().
 
         :param src_value: float-value of source attribute
         :return: evaluated weight of relation
+        :raise ArithmeticError: when evaluation divides by zero or its result is undefined
+        """
+        return float(self.evaluate_weights(np.array([src_value]))[0])
+
+    def evaluate_weights(self, src_values: np.ndarray) -> np.ndarray:
         """
-        return float(safe_eval(self.evaluation.replace('x', str(src_value))))
+        Evaluate weights of relation for many values at once.
+
+        Division by zero raises error like in Python arithmetic, instead of inf or nan weights.
+
+        :param src_values: array of float-values of source attribute
+        :return: array of evaluated weights of relation, the same shape as src_values
+        :raise ArithmeticError: when evaluation divides by zero or its result is undefined (i.e. 0/0)
+        """
+        x = np.asarray(src_values, dtype=np.float64)
+        with np.errstate(divide='raise', invalid='raise'):
+            return np.broadcast_to(np.asarray(self.get_function()(x), dtype=np.float64), x.shape).copy()
+
+    def clean(self):
+        try:
+            compile_evaluation(self.evaluation)
+        except ValueError as e:
+            raise ValidationError({'evaluation': str(e)})
+
+    def save(self, *args, **kwargs):
+        self._function = None
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return 'Attribute: %s' % self.name
 
     class Meta(DjangoPlusViewPermissionsMixin):
         unique_together = [['src', 'dest']]
+
+
+class DefinitionsVersion(models.Model):
+    """
+    Version of attributes and relations definitions, set to new random token on each change of them.
+
+    It is stored in DB (one row with id=1), so caches of definitions in all processes
+    of server are invalidated together without shared cache backend, see: definitions.cache.
+    The token is random (not a counter), so the version restored by rollback is never reused by next change.
+    """
+    version = models.CharField(max_length=32, default='')
@@ -1,3 +1,97 @@
-from django.test import TestCase
+import numpy as np
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from definitions.cache import get_attribute, get_serialized_attributes, get_version, start_request, finish_request
+from definitions.models import Attribute, DefinitionsVersion, Relation, compile_evaluation
+from users.models import User
+
+
+class DefinitionsCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author')
+        Attribute.objects.create(name='spot', author=cls.user, active=True, kind='c', description='old')
+
+    def test_invalidate_on_save(self):
+        version = get_version()
+        self.assertEqual(get_attribute('spot').description, 'old')
+
+        Attribute.objects.create(name='worm', author=self.user, active=False, kind='c')
+        self.assertNotEqual(get_version(), version)
+        self.assertEqual([a['name'] for a in get_serialized_attributes(kind='c', active=True)], ['spot'])
+        self.assertEqual([a['name'] for a in get_serialized_attributes(kind='c')], ['spot', 'worm'])
+
+    def test_invalidate_by_other_process(self):
+        self.assertEqual(get_attribute('spot').description, 'old')
+
+        # change made by other process: update without signals and change of version in DB
+        Attribute.objects.filter(name='spot').update(description='new')
+        self.assertEqual(get_attribute('spot').description, 'old')
+        DefinitionsVersion.objects.filter(pk=1).update(version='other')
+        self.assertEqual(get_attribute('spot').description, 'new')
+
+    def test_check_once_per_request(self):
+        start_request()
+        try:
+            self.assertEqual(get_attribute('spot').description, 'old')
+            Attribute.objects.filter(name='spot').update(description='new')
+            DefinitionsVersion.objects.filter(pk=1).update(version='other')
+            with self.assertNumQueries(0):
+                self.assertEqual(get_attribute('spot').description, 'old')
+
+            start_request()
+            self.assertEqual(get_attribute('spot').description, 'new')
+
+            # changes in current process are visible at once
+            Attribute.objects.create(name='worm', author=self.user, kind='c')
+            self.assertIsNotNone(get_attribute('worm'))
+        finally:
+            finish_request()
+
+    def test_rollback(self):
+        try:
+            with transaction.atomic():
+                Attribute.objects.create(name='rolled_back', author=self.user, kind='c')
+                self.assertIsNotNone(get_attribute('rolled_back'))
+                raise ValueError()
+        except ValueError:
+            pass
+
+        Attribute.objects.create(name='committed', author=self.user, kind='c')
+        self.assertIsNotNone(get_attribute('committed'))
+        with self.assertRaises(Attribute.DoesNotExist):
+            get_attribute('rolled_back')
+
+    def test_not_exists(self):
+        with self.assertRaises(Attribute.DoesNotExist):
+            get_attribute('nothing')
+
+
+class EvaluationTest(SimpleTestCase):
+    def test_compile(self):
+        f = compile_evaluation('(x * 2 + 1) ** 2 % 5 - -x')
+        self.assertEqual(f(3.0), 7 ** 2 % 5 + 3)
+        self.assertEqual(f(np.array([3.0, 1.0])).tolist(), [7 ** 2 % 5 + 3, 3 ** 2 % 5 + 1])
+        self.assertIs(compile_evaluation('x / 2'), compile_evaluation('x / 2'))
+
+    def test_invalid(self):
+        for evaluation in ['x +', 'y * 2', '__import__("os")', 'x.real', '"a"', 'True', 'x if x else 1', '[x]', 'lambda: 1']:
+            with self.assertRaises(ValueError, msg=evaluation):
+                compile_evaluation(evaluation)
+
+    def test_weights(self):
+        relation = Relation(evaluation='1 / (x - 1) + x // 2')
+        values = [0.0, 2.0, 3.5, -4.0]
+        weights = relation.evaluate_weights(np.array(values))
+        self.assertEqual(weights.tolist(), [relation.evaluate_weight(v) for v in values])
+        self.assertEqual(weights.tolist(), [1 / (v - 1) + v // 2 for v in values])
+        self.assertEqual(Relation(evaluation='5').evaluate_weights(np.array(values)).tolist(), [5.0] * 4)
+
+    def test_division_by_zero(self):
+        for evaluation in ['1 / (x - 1)', 'x // (x - 1)', 'x % (x - 1)', '(x - 1) ** -1', '(x - 1) / (x - 1)', '1 / 0']:
+            relation = Relation(evaluation=evaluation)
+            with self.assertRaises(ArithmeticError, msg=evaluation):
+                relation.evaluate_weight(1.0)
+            with self.assertRaises(ArithmeticError, msg=evaluation):
+                relation.evaluate_weights(np.array([2.0, 1.0]))
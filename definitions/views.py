@@ -1,4 +1,7 @@
+from rest_framework.response import Response
+
 from commons.serialization import SafeModelViewSet
+from definitions.cache import get_serialized_attributes
 from definitions.models import Attribute
 from definitions.serializers import AttributeSerializer
 
@@ -7,3 +10,9 @@ class AttributeViewSet(SafeModelViewSet):
     queryset = Attribute.objects.all()
     serializer_class = AttributeSerializer
     filterset_fields = '__all__'
+
+    def list(self, request, *args, **kwargs):
+        # the list without filters, search and ordering is served from cache
+        if not len(request.query_params):
+            return Response(get_serialized_attributes())
+        return super().list(request, *args, **kwargs)
@@ -47,5 +47,4 @@ export interface DetectionEntity extends Entity {
   mime: string;
   width: number;
   height: number;
-  frame_content: string;
 }
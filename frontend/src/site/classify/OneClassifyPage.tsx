@@ -1,10 +1,10 @@
 import React, { useCallback } from "react";
 import { AppContext, AppContextType } from "../../context/AppContext";
 import { Alert, Button, Card, Col, Container, Row } from "react-bootstrap";
-import { apiClient, ApiOptions } from "../../api/api";
+import { apiClient } from "../../api/api";
 import { withI18n, WithI18nProps } from "../../utils/i18n";
 import { AttributeEntity, DetectionEntity, DeviceEntity, UserEntity } from "../../api/entities";
-import { CommonClassifyProps, formatScopeInfo } from "./commons";
+import { BATCH_REFILL, BatchParams, CommonClassifyProps, formatScopeInfo, getBatchParams, isExpired, loadBatch, QueueItem } from "./commons";
 
 type OnSetClass = (value: number) => void;
 
@@ -13,14 +13,8 @@ export interface Detection extends Omit<DetectionEntity, "device"> {
   attributes: AttributeEntity[];
 }
 
-export interface GetRandomDetectionResponse {
+export interface SubmitClassifyResponse {
   user: UserEntity;
-  detection: Detection;
-}
-
-export interface ClassifyParams {
-  user?: number;
-  team?: number;
 }
 
 export interface SubmitClassifyRequest {
@@ -60,6 +54,10 @@ class OneClassifyPage extends React.Component<WithI18nProps & CommonClassifyProp
   state: ClassifyPageState = { loading: true, error: null };
   context!: AppContextType;
 
+  /** Leased hits to classify after shown detection */
+  queue: QueueItem<Detection>[] = [];
+  batchLoading = false;
+
   render() {
     const { _ } = this.props;
     const { detection, loading, error } = this.state;
@@ -81,7 +79,7 @@ class OneClassifyPage extends React.Component<WithI18nProps & CommonClassifyProp
       <>
         <Card.Subtitle className="mb-2 mt-2 text-muted text-center">{formatScopeInfo(_, this.props)}</Card.Subtitle>
         <div className="text-center div__img">
-          <img src={`data:image/png;base64,${detection!.frame_content}`} className="img__hit" alt={_("classify.common.img.alt")} />
+          <img src={detection!.image} className="img__hit" alt={_("classify.common.img.alt")} />
         </div>
         <Card.Subtitle className="mb-2 mt-2 text-muted text-center">{`ID: ${detection!.id}, ${_("classify.common.subtitle")}`}</Card.Subtitle>
 
@@ -133,36 +131,59 @@ class OneClassifyPage extends React.Component<WithI18nProps & CommonClassifyProp
     );
   }
 
-  loadRandomDetection = async (value: number | null) => {
+  loadNextBatch = async () => {
+    if (this.batchLoading) {
+      return;
+    }
     try {
-      const params: ClassifyParams = { user: this.props.user_id, team: this.props.team_id };
-
-      this.setState(() => ({ loading: true }));
-      const options: ApiOptions<SubmitClassifyRequest> = value
-        ? { method: "POST", data: { id: this.state.detection!.id, attribute: "class", value }, params }
-        : { params };
-      const detection = await apiClient<GetRandomDetectionResponse, SubmitClassifyRequest>("api/classify/one/", this.context, options);
-      this.setState(() => ({ loading: false, detection: detection!.data.detection, error: null, classes: {} }));
-      this.context.updateUser(detection!.data.user);
+      this.batchLoading = true;
+      this.queue.push(...(await loadBatch<Detection>("api/classify/one/", this.context, this.props)));
+      this.batchLoading = false;
+      this.setState(() => ({ error: null }));
+      if (!this.state.detection) {
+        this.showNextDetection();
+      }
     } catch (ApiError) {
+      this.batchLoading = false;
       this.setState(() => ({ loading: false, error: ApiError.getMessage(this.props._) }));
     }
   };
 
+  showNextDetection = () => {
+    this.queue = this.queue.filter(o => !isExpired(o));
+    const next = this.queue.shift();
+    this.setState(() => ({ loading: !next, detection: next?.detection }));
+    if (this.queue.length < BATCH_REFILL) {
+      this.loadNextBatch().then();
+    }
+  };
+
+  submitClassification = async (value: number) => {
+    const id = this.state.detection!.id;
+    this.showNextDetection();
+    try {
+      const options = { method: "POST" as const, data: { id, attribute: "class", value }, params: getBatchParams(this.props) };
+      const response = await apiClient<SubmitClassifyResponse, SubmitClassifyRequest, BatchParams>("api/classify/one/", this.context, options);
+      this.context.updateUser(response!.data.user);
+    } catch (ApiError) {
+      this.setState(() => ({ error: ApiError.getMessage(this.props._) }));
+    }
+  };
+
   onSetClass: OnSetClass = value => {
     if (!this.state.loading) {
-      this.loadRandomDetection(value).then();
+      this.submitClassification(value).then();
     }
   };
 
   onSubmit = () => {
     if (!this.state.loading) {
-      this.loadRandomDetection(null).then();
+      this.showNextDetection();
     }
   };
 
   componentDidMount(): void {
-    this.loadRandomDetection(null).then();
+    this.loadNextBatch().then();
   }
 }
 
@@ -1,10 +1,10 @@
 import React, { useCallback } from "react";
 import { AppContext, AppContextType } from "../../context/AppContext";
 import { Alert, Button, Card, Container } from "react-bootstrap";
-import { apiClient, ApiOptions } from "../../api/api";
+import { apiClient } from "../../api/api";
 import { withI18n, WithI18nProps } from "../../utils/i18n";
 import { AttributeEntity, DetectionEntity, DeviceEntity, UserEntity } from "../../api/entities";
-import { Classes, CommonClassifyProps, formatScopeInfo } from "./commons";
+import { BATCH_REFILL, BatchParams, Classes, CommonClassifyProps, formatScopeInfo, getBatchParams, isExpired, loadBatch, QueueItem } from "./commons";
 
 const HardcodedAttributes = [
   { name: "spot", title: "classify.attr.spot" },
@@ -23,14 +23,8 @@ export interface Detection extends Omit<DetectionEntity, "device"> {
   attributes: AttributeEntity[];
 }
 
-export interface GetRandomDetectionResponse {
+export interface SubmitClassifyResponse {
   user: UserEntity;
-  detection: Detection;
-}
-
-export interface ClassifyParams {
-  user?: number;
-  team?: number;
 }
 
 export interface SubmitClassifyRequest {
@@ -70,6 +64,10 @@ class ScaledClassifyPage extends React.Component<WithI18nProps & CommonClassifyP
   state: ClassifyPageState = { loading: true, error: null, classes: {} };
   context!: AppContextType;
 
+  /** Leased hits to classify after shown detection */
+  queue: QueueItem<Detection>[] = [];
+  batchLoading = false;
+
   render() {
     const { _ } = this.props;
     const { detection, loading, error } = this.state;
@@ -95,7 +93,7 @@ class ScaledClassifyPage extends React.Component<WithI18nProps & CommonClassifyP
       <>
         <Card.Subtitle className="mb-2 mt-2 text-muted text-center">{formatScopeInfo(_, this.props)}</Card.Subtitle>
         <div className="text-center div__img">
-          <img src={`data:image/png;base64,${detection!.frame_content}`} className="img__hit" alt={_("classify.common.img.alt")} />
+          <img src={detection!.image} className="img__hit" alt={_("classify.common.img.alt")} />
         </div>
         <Card.Subtitle className="mb-2 mt-2 text-muted text-center">{`ID: ${detection!.id}, ${_("classify.common.subtitle")}`}</Card.Subtitle>
         <div className="div__attributes">
@@ -127,35 +125,61 @@ class ScaledClassifyPage extends React.Component<WithI18nProps & CommonClassifyP
     );
   }
 
-  loadRandomDetection = async (submit: boolean) => {
+  loadNextBatch = async () => {
+    if (this.batchLoading) {
+      return;
+    }
     try {
-      const params: ClassifyParams = { user: this.props.user_id, team: this.props.team_id };
-
-      this.setState(() => ({ loading: true }));
-      const options: ApiOptions<SubmitClassifyRequest> = submit
-        ? { method: "POST", data: { id: this.state.detection!.id, classes: this.state.classes }, params }
-        : { params };
-      const detection = await apiClient<GetRandomDetectionResponse, SubmitClassifyRequest>("api/classify/scaled/", this.context, options);
-      this.setState(() => ({ loading: false, detection: detection!.data.detection, error: null, classes: {} }));
-      this.context.updateUser(detection!.data.user);
+      this.batchLoading = true;
+      this.queue.push(...(await loadBatch<Detection>("api/classify/scaled/", this.context, this.props)));
+      this.batchLoading = false;
+      this.setState(() => ({ error: null }));
+      if (!this.state.detection) {
+        this.showNextDetection();
+      }
     } catch (ApiError) {
+      this.batchLoading = false;
       this.setState(() => ({ loading: false, error: ApiError.getMessage(this.props._) }));
     }
   };
 
+  showNextDetection = () => {
+    this.queue = this.queue.filter(o => !isExpired(o));
+    const next = this.queue.shift();
+    this.setState(() => ({ loading: !next, detection: next?.detection, classes: {} }));
+    if (this.queue.length < BATCH_REFILL) {
+      this.loadNextBatch().then();
+    }
+  };
+
+  submitClassification = async () => {
+    const data: SubmitClassifyRequest = { id: this.state.detection!.id, classes: this.state.classes };
+    this.showNextDetection();
+    try {
+      const options = { method: "POST" as const, data, params: getBatchParams(this.props) };
+      const response = await apiClient<SubmitClassifyResponse, SubmitClassifyRequest, BatchParams>("api/classify/scaled/", this.context, options);
+      this.context.updateUser(response!.data.user);
+    } catch (ApiError) {
+      this.setState(() => ({ error: ApiError.getMessage(this.props._) }));
+    }
+  };
+
   onSetClass: OnSetClass = (attribute, value) => {
     this.setState(old => ({ classes: { ...old.classes, [attribute]: value } }));
   };
 
   onSubmit = () => {
     if (!this.state.loading) {
-      const filled = this.getFilledCount();
-      this.loadRandomDetection(filled > 0).then();
+      if (this.getFilledCount() > 0) {
+        this.submitClassification().then();
+      } else {
+        this.showNextDetection();
+      }
     }
   };
 
   componentDidMount(): void {
-    this.loadRandomDetection(false).then();
+    this.loadNextBatch().then();
   }
 
   getFilledCount = () => {
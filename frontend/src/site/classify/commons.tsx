@@ -1,4 +1,7 @@
 import { I18n } from "../../utils/i18n";
+import { apiClient } from "../../api/api";
+import { AppContextType } from "../../context/AppContext";
+import { UserEntity } from "../../api/entities";
 
 export type Classes = { [attrib: string]: number | null };
 
@@ -24,3 +27,100 @@ export function formatScopeInfo(_: I18n, props: CommonClassifyProps): string {
 
   return `${_("classify.scope")}: ${scopes.join(", ")}`;
 }
+
+/** Count of hits leased to user in one batch, see: BaseRandomToClassify.get_next_to_classify() on server */
+export const BATCH_SIZE = 10;
+
+/** Next batch is loaded when count of hits in local queue is less than this */
+export const BATCH_REFILL = 3;
+
+/** Hits are dropped from local queue this time before their lease expires, so there is a time for classify shown hit */
+const EXPIRES_MARGIN = 60 * 1000;
+
+/** Hit in local queue with its lease expiry (ms since epoch) */
+export interface QueueItem<D> {
+  detection: D;
+  expires: number;
+}
+
+interface GetBatchResponse<D> {
+  user: UserEntity;
+  detections: D[];
+  expires: string;
+}
+
+export interface BatchParams {
+  user?: number;
+  team?: number;
+  batch: 1;
+  count?: number;
+}
+
+export function getBatchParams(props: CommonClassifyProps, count?: number): BatchParams {
+  return { user: props.user_id, team: props.team_id, batch: 1, count };
+}
+
+interface SpriteDetection {
+  id: number;
+  image: string;
+}
+
+interface GetSpriteResponse {
+  image: string | null;
+  coords: { [id: string]: { x: number; y: number; width: number; height: number } };
+}
+
+/**
+ * Load crops of all detections by one request of sprite (see: serve_sprite() on server) instead of request per crop.
+ * @param detections detections of batch
+ * @param context app context used for authorization
+ * @return detections with image replaced by data URI of crop cut from sprite, detections without crop in sprite keep its image URL
+ */
+export async function loadCropsFromSprite<D extends SpriteDetection>(detections: D[], context: AppContextType): Promise<D[]> {
+  const params = { ids: detections.map(d => d.id).join(",") };
+  const response = await apiClient<GetSpriteResponse>("images/sprite/", context, { params });
+  const { image, coords } = response!.data;
+  if (!image) {
+    return detections;
+  }
+
+  const sprite = new Image();
+  sprite.src = image;
+  await sprite.decode();
+  return detections.map(d => {
+    const c = coords[d.id];
+    if (!c) {
+      return d;
+    }
+    const canvas = document.createElement("canvas");
+    canvas.width = c.width;
+    canvas.height = c.height;
+    canvas.getContext("2d")!.drawImage(sprite, c.x, c.y, c.width, c.height, 0, 0, c.width, c.height);
+    return { ...d, image: canvas.toDataURL() };
+  });
+}
+
+/**
+ * Lease next batch of hits to classify with their crops, updates user in context.
+ * @param endpoint classify API endpoint
+ * @param context app context used for authorization
+ * @param props scope of hits
+ * @return items to append to local queue
+ */
+export async function loadBatch<D extends SpriteDetection>(endpoint: string, context: AppContextType, props: CommonClassifyProps): Promise<QueueItem<D>[]> {
+  const response = await apiClient<GetBatchResponse<D>, void, BatchParams>(endpoint, context, { params: getBatchParams(props, BATCH_SIZE) });
+  context.updateUser(response!.data.user);
+  const expires = Date.parse(response!.data.expires);
+
+  let detections = response!.data.detections;
+  try {
+    detections = await loadCropsFromSprite(detections, context);
+  } catch (e) {
+    // crops are loaded by image URL of each detection
+  }
+  return detections.map(detection => ({ detection, expires }));
+}
+
+export function isExpired(item: QueueItem<any>): boolean {
+  return Date.now() > item.expires - EXPIRES_MARGIN;
+}
@@ -1,4 +1,5 @@
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional, Tuple
 
 from hit_analysis.classification.artifact.hot_pixel import hot_pixel
 from hit_analysis.classification.artifact.near_hot_pixel import near_hot_pixel
@@ -13,7 +14,8 @@ from hit_analysis.commons.consts import CLASSIFIED, CLASS_ARTIFACT, DEVICE_ID, F
 from hit_analysis.commons.grouping import group_by_device_id, group_by_resolution, group_by_timestamp_division
 from hit_analysis.commons.utils import get_resolution_key, join_tuple
 from hit_analysis.image.cut_reconstruction import check_all_artifacts, do_reconstruct
-from hit_analysis.image.image_utils import count_of_brightest_pixels
+from hit_analysis.image.image_utils import count_of_brightest_pixels_for_thresholds, release_brightness_array, get_brightness_histogram, \
+    pack_detection, unpack_detection, merge_detection, pack_changes
 
 
 def store_debug_pngs(detections, config: Config):
@@ -108,37 +110,107 @@ def image_simple_classify(detections: List[dict], config: Config) -> None:
             do_process = False
 
         if do_process:
+            if config.brightness_histogram:
+                get_brightness_histogram(d)
+
             too_dark(d, config.too_dark_spread)
             too_large_bright_area_threshold = config.too_large_bright_area_threshold
             too_large_bright_area(d, too_large_bright_area_threshold(detection=d), config.too_large_bright_area_bac)
 
             # additional image_brighter_count_XXX calculation
             if config.count_of_brightest_pixels:
-                for t in range(config.count_of_brightest_pixels_from, config.count_of_brightest_pixels_to):
-                    count_of_brightest_pixels(d, t)
+                thresholds = range(config.count_of_brightest_pixels_from, config.count_of_brightest_pixels_to)
+                count_of_brightest_pixels_for_thresholds(d, thresholds)
+
+            release_brightness_array(d)
 
             count += 1
     config.print_log('... simple classify %d done' % count, timing)
 
 
-def analyse_detections_batch(detections: List[dict], config: Config) -> None:
+def analyse_device_detections(device_id: int, detections: List[dict], config: Config) -> None:
+    """
+    Analyse detections from one device, the detections are grouped by resolution.
+    :param device_id: device_id, used for logs only
+    :param detections: detections with the same device_id and loaded images
+    :param config: config object
+    """
+    timing = config.print_log('Processing for device_id %d...' % device_id)
+
+    by_resolution = group_by_resolution(detections)
+    for resolution, for_resolution in by_resolution.items():
+        config.change_log_indent(1)
+        filter_artifacts_and_reconstruct(for_resolution, config)
+        image_simple_classify(for_resolution, config)
+        store_debug_pngs(for_resolution, config)
+        config.change_log_indent(-1)
+
+    config.print_log('... processing for device_id %d done' % device_id, timing)
+
+
+def analyse_packed_detections(device_id: int, packed: List[dict], config: Config) -> List[Tuple[dict, List[str]]]:
+    """
+    Worker of process pool for ``analyse_detections_batch()``.
+    :param device_id: device_id, used for logs only
+    :param packed: detections from one device packed by ``pack_detection()``
+    :param config: config object
+    :return: keys changed by analysis packed by ``pack_changes()``,
+      the image is included only when was replaced by reconstruction
+    """
+    detections = [unpack_detection(p) for p in packed]
+    before = [dict(d) for d in detections]
+    analyse_device_detections(device_id, detections, config)
+    return [pack_changes(b, d) for b, d in zip(before, detections)]
+
+
+DeviceAnalysedCallback = Callable[[int, List[dict]], None]
+
+
+def analyse_in_process_pool(by_device_id: Dict[int, List[dict]], config: Config, workers: int, on_analysed: Optional[DeviceAnalysedCallback] = None) -> None:
+    """
+    Analyse groups of detections by device_id in parallel processes.
+
+    Images are sent to workers as raw bytes and results are merged back to provided detections.
+    :param by_device_id: detections grouped by device_id
+    :param config: config object
+    :param workers: count of processes
+    :param on_analysed: optional, called with device_id and detections when results of device are merged
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for device_id, for_device_id in sorted(by_device_id.items(), key=lambda x: -len(x[1])):
+            packed = [pack_detection(d) for d in for_device_id]
+            futures[executor.submit(analyse_packed_detections, device_id, packed, config)] = device_id
+
+        for future in as_completed(futures):
+            device_id = futures[future]
+            for d, (changed, removed) in zip(by_device_id[device_id], future.result()):
+                merge_detection(d, changed, removed)
+            if on_analysed:
+                on_analysed(device_id, by_device_id[device_id])
+
+
+def analyse_detections_batch(detections: List[dict], config: Config, workers: int = 1, on_analysed: Optional[DeviceAnalysedCallback] = None) -> None:
+    """
+    Analyse detections by all classifiers, detections are grouped by device_id and resolution.
+    :param detections: detections with loaded images, see: ``load_image()``
+    :param config: config object
+    :param workers: count of processes, when greater than 1 then groups by device_id are analysed in process pool
+    :param on_analysed: optional, called with device_id and detections as soon as the group by device_id is analysed,
+      i.e. for write results before analysis of next groups
+    """
     timing = timing_full = config.print_log('Load detections batch for %d detections...' % len(detections))
 
     config.change_log_indent(1)
     by_device_id = group_by_device_id(detections)
     config.print_log('... grouped by device_id...', timing)
-    for device_id, for_device_id in by_device_id.items():
-        timing = config.print_log('Processing for device_id %d...' % device_id)
-
-        by_resolution = group_by_resolution(for_device_id)
-        for resolution, for_resolution in by_resolution.items():
-            config.change_log_indent(1)
-            filter_artifacts_and_reconstruct(for_resolution, config)
-            image_simple_classify(for_resolution, config)
-            store_debug_pngs(for_resolution, config)
-            config.change_log_indent(-1)
-
-        config.print_log('... processing for device_id %d done' % device_id, timing)
+    if workers > 1 and len(by_device_id) > 1:
+        analyse_in_process_pool(by_device_id, config, workers, on_analysed)
+    else:
+        for device_id, for_device_id in by_device_id.items():
+            analyse_device_detections(device_id, for_device_id, config)
+            if on_analysed:
+                on_analysed(device_id, for_device_id)
 
     config.change_log_indent(-1)
 
@@ -2,6 +2,7 @@ from typing import List, Tuple
 
 from hit_analysis.commons.classify import classify_by_count_in_group
 from hit_analysis.commons.consts import CLASSIFIED, CLASS_ARTIFACT, X, Y, ARTIFACT_NEAR_HOT_PIXEL, ARTIFACT_NEAR_HOT_PIXEL_REFXY
+from hit_analysis.commons.spatial import iter_near_cells, add_to_grid
 from hit_analysis.commons.utils import point_to_point_distance, get_and_set
 
 
@@ -22,6 +23,9 @@ def near_hot_pixel(detections: List[dict], often: int = 3, distance: float = 5)
     and when distance is less than ``distance`` arg then append to key and break loop.
     When loop was end and near keys not found the ``(X', Y')`` make new key.
 
+    The previous keys are stored in uniform grid with cell size equal to ``distance``,
+    so only keys from neighboring cells are compared.
+
     The distance measurement of keys is the Euclidean distance between ``(X, Y)`` and ``(X', Y')`` on 2D plane.
 
     When in one key we have more than ``often`` detections, we classify all as near_hot_pixel artifact.
@@ -43,12 +47,18 @@ def near_hot_pixel(detections: List[dict], often: int = 3, distance: float = 5)
     :return: tuple of (list of classified, list of no classified)
     """
     grouped = {}
+    order = {}
+    grid = {}
     for detection in detections:
         key_prim = (detection.get(X), detection.get(Y))
-        for key in grouped.keys():
-            if point_to_point_distance(key, key_prim) < distance:
-                key_prim = key
-                break
+        if distance > 0:
+            near = [key for key in iter_near_cells(grid, key_prim, distance) if point_to_point_distance(key, key_prim) < distance]
+            if len(near):
+                key_prim = min(near, key=order.get)
+        if key_prim not in order:
+            order[key_prim] = len(order)
+            if distance > 0:
+                add_to_grid(grid, key_prim, distance, key_prim)
         detection[ARTIFACT_NEAR_HOT_PIXEL_REFXY] = key_prim
         get_and_set(grouped, key_prim, []).append(detection)
 
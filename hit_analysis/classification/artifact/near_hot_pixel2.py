@@ -1,8 +1,9 @@
-import itertools
 from typing import List, Tuple
 
 from hit_analysis.commons.classify import classify_by_lambda
 from hit_analysis.commons.consts import X, Y, ARTIFACT_NEAR_HOT_PIXEL2
+from hit_analysis.commons.grouping import group_by_lambda
+from hit_analysis.commons.spatial import iter_near_cells, add_to_grid
 from hit_analysis.commons.utils import point_to_point_distance, get_and_set
 
 
@@ -21,6 +22,8 @@ def near_hot_pixel2(detections: List[dict], often: int = 3, distance: float = 5)
     In near hot pixel v2 all other detections who distance is less than ``distance`` are counted to ``artifact_near_hot_pixel2`` object's key.
 
     The distance measurement of keys is the Euclidean distance between ``(X, Y)`` and ``(X', Y')`` on 2D plane.
+    Detections are grouped by ``(X, Y)`` and keys are stored in uniform grid with cell size equal to ``distance``,
+    so only keys from neighboring cells are compared.
 
     When in one key we have more than ``often`` detections, we classify all as near_hot_pixel2 artifact.
 
@@ -39,16 +42,18 @@ def near_hot_pixel2(detections: List[dict], often: int = 3, distance: float = 5)
 
     :return: tuple of (list of classified, list of no classified)
     """
-    to_compare = itertools.combinations_with_replacement(detections, 2)
-    for d, d_prim in to_compare:
-        key = (d.get(X), d.get(Y))
-        key_prim = (d_prim.get(X), d_prim.get(Y))
-
-        get_and_set(d, ARTIFACT_NEAR_HOT_PIXEL2, 0)
-        get_and_set(d_prim, ARTIFACT_NEAR_HOT_PIXEL2, 0)
-
-        if point_to_point_distance(key, key_prim) < distance:
-            d[ARTIFACT_NEAR_HOT_PIXEL2] += 1
-            d_prim[ARTIFACT_NEAR_HOT_PIXEL2] += 1
+    by_xy = group_by_lambda(detections, lambda x, ret: (x.get(X), x.get(Y)))
+    grid = {}
+    if distance > 0:
+        for key in by_xy.keys():
+            add_to_grid(grid, key, distance, key)
+
+    for key, ds in by_xy.items():
+        near = 0
+        if distance > 0:
+            # detection is compared with itself twice, so it is counted in own key and in +1
+            near = 1 + sum(len(by_xy[key_prim]) for key_prim in iter_near_cells(grid, key, distance) if point_to_point_distance(key, key_prim) < distance)
+        for d in ds:
+            d[ARTIFACT_NEAR_HOT_PIXEL2] = get_and_set(d, ARTIFACT_NEAR_HOT_PIXEL2, 0) + near
 
     return classify_by_lambda(detections, lambda x: x.get(ARTIFACT_NEAR_HOT_PIXEL2) >= often)
@@ -1,4 +1,3 @@
-import itertools
 from typing import List, Tuple
 
 from hit_analysis.commons.classify import classify_by_lambda
@@ -7,6 +6,30 @@ from hit_analysis.commons.grouping import group_by_timestamp_division
 from hit_analysis.commons.utils import get_and_set
 
 
+def count_near_in_window(keys: List[int], time_window: int) -> List[int]:
+    """
+    Count of other keys in distance less than ``time_window`` for each key.
+
+    Two pointers sliding window is used, so complexity is O(N).
+    :param keys: sorted list of unique keys
+    :param time_window: distance threshold
+    :return: list of counts in the same order like ``keys``
+    """
+    if time_window <= 0:
+        return [0] * len(keys)
+
+    ret = []
+    lo = 0
+    hi = 0
+    for key in keys:
+        while key - keys[lo] >= time_window:
+            lo += 1
+        while hi < len(keys) and keys[hi] - key < time_window:
+            hi += 1
+        ret.append(hi - lo - 1)
+    return ret
+
+
 def too_often(detections: List[dict], often: int = 4, time_window: int = 60000) -> Tuple[List[dict], List[dict]]:
     """
     Analyse by too often classifier.
@@ -25,12 +48,13 @@ def too_often(detections: List[dict], often: int = 4, time_window: int = 60000)
     At second, all other detections who distance is less than ``time_window`` are counted to ``artifact_too_often`` object's key.
 
     The distance measurement of keys is the Euclidean distance between ``timestamp`` and ``timestamp'`` in 1D space.
+    The near detections are counted by sliding window over sorted ``timestamp`` values, see: ``count_near_in_window()``.
 
     Required keys:
       * ``timestamp``: for group by the same original image frame, and count of detections in near
 
     Keys will be add:
-      * ``artifact_hot_pixel``: count of detections in near ``timestamp``.
+      * ``artifact_too_often``: count of other original image frames in near ``timestamp``.
       * ``classified``: set to ``artifact`` when detection will be classified as too_often artifact.
 
     Example::
@@ -41,16 +65,8 @@ def too_often(detections: List[dict], often: int = 4, time_window: int = 60000)
     :return: tuple of (list of classified, list of no classified)
     """
     grouped = group_by_timestamp_division(detections, 1)
-    if len(grouped.keys()) == 1:
-        # zero value guard (fill 0 when only one group of detections on the provided detections list)
-        for group in grouped.values():
-            for d in group:
-                get_and_set(d, ARTIFACT_TOO_OFTEN, 0)
-    else:
-        to_compare = itertools.combinations(grouped.keys(), 2)
-        for key, key_prim in to_compare:
-            for d in [*grouped.get(key), *grouped.get(key_prim)]:
-                get_and_set(d, ARTIFACT_TOO_OFTEN, 0)
-                if abs(key_prim - key_prim) < time_window:
-                    d[ARTIFACT_TOO_OFTEN] += 1
+    keys = sorted(grouped.keys())
+    for key, count in zip(keys, count_near_in_window(keys, time_window)):
+        for d in grouped.get(key):
+            d[ARTIFACT_TOO_OFTEN] = get_and_set(d, ARTIFACT_TOO_OFTEN, 0) + count
     return classify_by_lambda(detections, lambda x: x.get(ARTIFACT_TOO_OFTEN) >= often)
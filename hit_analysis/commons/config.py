@@ -24,9 +24,10 @@ class Config:
     too_large_bright_area_bac = 30
     too_large_bright_area_threshold = by_darkness_brightest_threshold
 
-    count_of_brightest_pixels = False  # set to True cause significantly increase time of analysis
+    count_of_brightest_pixels = False  # set to True to calc image_brighter_count_XXX for all thresholds from range below
     count_of_brightest_pixels_from = 0
     count_of_brightest_pixels_to = 256
+    brightness_histogram = True  # set to False to scan pixels instead of 256-bins histogram (histogram is stored in image_histogram key)
 
     log_indent = 0
 
@@ -11,11 +11,24 @@ Y = 'y'
 
 FRAME_CONTENT = 'frame_content'  # excluded in CSV
 
+USER_ID = 'user_id'
+TEAM_ID = 'team_id'
+TIME_RECEIVED = 'time_received'
+LATITUDE = 'latitude'
+LONGITUDE = 'longitude'
+ALTITUDE = 'altitude'
+ACCURACY = 'accuracy'
+PROVIDER = 'provider'
+SOURCE = 'source'
+METADATA = 'metadata'
+
 
 # added fields by processing functions (all excluded in CSV)
 FRAME_DECODED = 'frame_decoded'
 IMAGE = 'image'
 ORIG_IMAGE = 'orig_image'
+IMAGE_BRIGHTNESS = 'image_brightness'  # cached uint8 array of brightest channel of each pixel
+IMAGE_HISTOGRAM = 'image_histogram'  # 256-bins histogram of IMAGE_BRIGHTNESS
 
 # image basic stats
 DARKNESS = 'image_darkness'  # bright of darkness pixel (0-255)
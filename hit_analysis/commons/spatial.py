@@ -0,0 +1,43 @@
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+Point = Tuple[int, int]
+Grid = Dict[Tuple[int, int], List[Any]]
+
+
+def get_cell(point: Point, size: float) -> Tuple[int, int]:
+    """
+    Cell of uniform grid with the point.
+    :param point: (X, Y) coordinates
+    :param size: width and height of cell
+    :return: (column, row) of cell
+    """
+    return int(point[0] // size), int(point[1] // size)
+
+
+def add_to_grid(grid: Grid, point: Point, size: float, value: Any) -> None:
+    """
+    Append value to cell of uniform grid with the point.
+    :param grid: dict of cells, will be modified
+    :param point: (X, Y) coordinates
+    :param size: width and height of cell
+    :param value: value to store in cell
+    """
+    grid.setdefault(get_cell(point, size), []).append(value)
+
+
+def iter_near_cells(grid: Grid, point: Point, size: float) -> Iterable[Any]:
+    """
+    Iterate over values stored in cell of the point and all 8 neighboring cells.
+
+    When cell ``size`` is equal to searched distance then all values stored for points
+    in distance less than ``size`` are iterated (but not only them, please check the distance).
+    :param grid: dict of cells made by ``add_to_grid()``
+    :param point: (X, Y) coordinates
+    :param size: width and height of cell
+    :return: iterator over values
+    """
+    cx, cy = get_cell(point, size)
+    for x in range(cx - 1, cx + 2):
+        for y in range(cy - 1, cy + 2):
+            yield from grid.get((x, y), ())
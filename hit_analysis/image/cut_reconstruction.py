@@ -5,6 +5,7 @@ from PIL import Image
 
 from hit_analysis.commons.config import Config
 from hit_analysis.commons.consts import IMAGE, CROP_X, CROP_Y, CROP_SIZE, FRAME_DECODED, CLASSIFIED, CLASS_ARTIFACT, ORIG_IMAGE
+from hit_analysis.image.image_utils import release_brightness_array
 
 
 def append_to_frame(image: Image, detection: dict):
@@ -29,6 +30,7 @@ def replace_from_frame(image: Image, detection: dict):
     hit_img = image.crop((cx, cy, cx + w, cy + h))
     detection[ORIG_IMAGE] = detection[IMAGE]
     detection[IMAGE] = hit_img
+    release_brightness_array(detection, with_histogram=True)
     with BytesIO() as output:
         hit_img.save(output, format="png")
         # hit_img.save('/tmp/%d.png' % detection.get('id'))
@@ -1,13 +1,19 @@
+import math
 from io import BytesIO
-from typing import Tuple, Callable
+from typing import Tuple, Callable, Iterable, Dict, Optional, List
 
+import numpy as np
 from PIL import Image
 
 from hit_analysis.commons.consts import IMAGE, FRAME_DECODED, DARKNESS, BRIGHTEST, BRIGHTER_COUNT, FRAME_CONTENT, CROP_SIZE, EDGE, X, \
-    WIDTH, Y, HEIGHT, CROP_X, CROP_Y
+    WIDTH, Y, HEIGHT, CROP_X, CROP_Y, IMAGE_BRIGHTNESS, IMAGE_HISTOGRAM, ORIG_IMAGE
+from hit_analysis.io.image_cache import ImageCache
 from hit_analysis.io.io_utils import decode_base64
 
 
+ArrayParser = Callable[[np.ndarray], np.ndarray]
+
+
 def get_brightest_channel(pixel: Tuple[int, int, int, int]) -> int:
     """
     Get brightest channel for pixel
@@ -18,7 +24,109 @@ def get_brightest_channel(pixel: Tuple[int, int, int, int]) -> int:
     return max([r, g, b])
 
 
-def load_image(detection: dict) -> Image:
+def get_brightest_channel_array(pixels: np.ndarray) -> np.ndarray:
+    """
+    Vectorized version of ``get_brightest_channel()``.
+    :param pixels: RGBA pixels as uint8 array in shape (height, width, 4)
+    :return: brightest channel from [R, G, B] for each pixel in shape (height, width)
+    """
+    return pixels[:, :, :3].max(axis=2)
+
+
+def get_brightness_array(detection: dict, pixel_parser: ArrayParser = get_brightest_channel_array) -> np.ndarray:
+    """
+    Convert image to array of one value per pixel by pixel_parser.
+
+    The image is converted only once. The result for default pixel_parser is cached in ``image_brightness`` key
+    and should be released by ``release_brightness_array()`` when is no longer needed.
+    :param detection: detection with 'image' field
+    :param pixel_parser: get one value from RGBA channels for all pixels
+    :return: uint8 array in shape (height, width)
+    """
+    assert detection.get(IMAGE) is not None
+
+    cached = pixel_parser is get_brightest_channel_array
+    if cached and detection.get(IMAGE_BRIGHTNESS) is not None:
+        return detection.get(IMAGE_BRIGHTNESS)
+
+    pixels = np.asarray(detection.get(IMAGE), dtype=np.uint8)
+    brightness = pixel_parser(pixels).astype(np.uint8)
+    if cached:
+        detection[IMAGE_BRIGHTNESS] = brightness
+    return brightness
+
+
+def release_brightness_array(detection: dict, with_histogram: bool = False) -> None:
+    """
+    Remove cached array made by ``get_brightness_array()`` for memory free.
+    :param detection: detection
+    :param with_histogram: remove also histogram made by ``get_brightness_histogram()``, i.e. when image was changed
+    """
+    detection.pop(IMAGE_BRIGHTNESS, None)
+    if with_histogram:
+        detection.pop(IMAGE_HISTOGRAM, None)
+
+
+def get_brightness_histogram(detection: dict, pixel_parser: ArrayParser = get_brightest_channel_array) -> np.ndarray:
+    """
+    Make 256-bins histogram of pixel values from ``get_brightness_array()``.
+
+    The result for default pixel_parser is stored in ``image_histogram`` key as compact (uint16 for crops
+    smaller than 65536 pixels) array and is used by ``measure_darkness_brightest()``, ``count_of_brightest_pixels()``
+    and ``count_of_brightest_pixels_for_thresholds()`` instead of scan of pixels.
+    :param detection: detection with 'image' field
+    :param pixel_parser: get one value from RGBA channels for all pixels
+    :return: array of 256 counts of pixels with value equal to index
+    """
+    cached = pixel_parser is get_brightest_channel_array
+    if cached and detection.get(IMAGE_HISTOGRAM) is not None:
+        return detection.get(IMAGE_HISTOGRAM)
+
+    brightness = get_brightness_array(detection, pixel_parser)
+    dtype = np.uint16 if brightness.size <= np.iinfo(np.uint16).max else np.uint32
+    histogram = np.bincount(brightness.ravel(), minlength=256).astype(dtype)
+    if cached:
+        detection[IMAGE_HISTOGRAM] = histogram
+    return histogram
+
+
+def get_brighter_counts(histogram: np.ndarray) -> np.ndarray:
+    """
+    Reverse cumulative sum of histogram made by ``get_brightness_histogram()``.
+    :param histogram: array of 256 counts of pixels
+    :return: array of 257 counts, the N-th value is count of pixels brighter or equal than N
+    """
+    return np.append(np.cumsum(histogram[::-1], dtype=np.int64)[::-1], 0)
+
+
+def histogram_index(threshold: float) -> int:
+    """
+    Index in ``get_brighter_counts()`` result for threshold, the threshold may be not integer.
+    """
+    return min(max(math.ceil(threshold), 0), 256)
+
+
+def get_stored_histogram(detection: dict, pixel_parser: ArrayParser) -> Optional[np.ndarray]:
+    """
+    Histogram stored by ``get_brightness_histogram()`` or None when not stored or pixel_parser is not default.
+    """
+    if pixel_parser is not get_brightest_channel_array:
+        return None
+    return detection.get(IMAGE_HISTOGRAM)
+
+
+def decode_frame_content(detection: dict) -> bytes:
+    """
+    Decode ``frame_content`` to ``frame_decoded`` key when is not decoded yet.
+    :param detection: detection object with frame_decoded or frame_content
+    :return: decoded content of image file
+    """
+    if detection.get(FRAME_DECODED) is None:
+        detection[FRAME_DECODED] = decode_base64(detection.get(FRAME_CONTENT))
+    return detection.get(FRAME_DECODED)
+
+
+def load_image(detection: dict, cache: Optional[ImageCache] = None) -> Image:
     """
     Load image from ``frame_content`` to object's key with some calculated metrics.
 
@@ -34,14 +142,19 @@ def load_image(detection: dict) -> Image:
 
     The ``crop_x`` and ``crop_y`` may be used to reconstruction original image frame from loaded images.
 
+    When ``cache`` is provided then decoded image is loaded from cache or stored in cache after decode.
+    Note: the ``frame_encoded`` is not set when image was loaded from cache, see: ``decode_frame_content()``.
+
     :param detection: detection object with frame_encoded or frame_content
+    :param cache: optional cache of decoded images
     :return: image object
     """
-    if detection.get(FRAME_DECODED) is None:
-        detection[FRAME_DECODED] = decode_base64(detection.get(FRAME_CONTENT))
-
-    frame_decoded = detection.get(FRAME_DECODED)
-    img = Image.open(BytesIO(frame_decoded)).convert('RGBA')
+    img = cache.load(detection) if cache is not None else None
+    if img is None:
+        frame_decoded = decode_frame_content(detection)
+        img = Image.open(BytesIO(frame_decoded)).convert('RGBA')
+        if cache is not None:
+            cache.store(detection, img)
     detection[IMAGE] = img
 
     # extract basic image parameters
@@ -106,58 +219,190 @@ def load_image(detection: dict) -> Image:
     return img
 
 
-def measure_darkness_brightest(detection: dict, pixel_parser: Callable[[Tuple[int, int, int, int]], int] = get_brightest_channel) -> Tuple[int, int]:
+def measure_darkness_brightest(detection: dict, pixel_parser: ArrayParser = get_brightest_channel_array) -> Tuple[int, int]:
     """
     Measure brightest and darkness pixel excluding #000 pixels and using pixel_parser for get pixel value.
     Set values to 'image_darkness' and 'image_brightest' fields and return.
     :param detection: detection with 'image' field
-    :param pixel_parser: get one value from RGBA channels
+    :param pixel_parser: get one value from RGBA channels for all pixels
     :return: tuple of darkness and brightest
     """
-    assert detection.get(IMAGE) is not None
+    histogram = get_stored_histogram(detection, pixel_parser)
+    if histogram is not None:
+        non_black = np.flatnonzero(histogram[1:]) + 1
+        darkness = int(non_black[0]) if non_black.size else 255
+        brightest = int(non_black[-1]) if non_black.size else 0
+    else:
+        brightness = get_brightness_array(detection, pixel_parser)
+        non_black = brightness[brightness != 0]
+        darkness = int(non_black.min()) if non_black.size else 255
+        brightest = int(non_black.max()) if non_black.size else 0
 
-    hit_img = detection.get(IMAGE)
-    width, height = hit_img.size
-
-    darkness = 255
-    brightest = 0
-    for cy in range(height):
-        for cx in range(width):
-            g = pixel_parser(hit_img.getpixel((cx, cy)))
-            if g != 0:
-                brightest = max(brightest, g)
-                darkness = min(darkness, g)
     detection[DARKNESS] = darkness
     detection[BRIGHTEST] = brightest
     return darkness, brightest
 
 
-def count_of_brightest_pixels(detection: dict, threshold: int, pixel_parser: Callable[[Tuple[int, int, int, int]], int] = get_brightest_channel) -> int:
+def count_of_brightest_pixels(detection: dict, threshold: int, pixel_parser: ArrayParser = get_brightest_channel_array) -> int:
     """
     Count pixels brighter than threshold param. Using pixel_parser for get pixel value.
     Set values to 'image_brighter_count_{threshold}' fields and return.
     :param detection: detection with 'image' field
     :param threshold: greater of equal bright of pixel will be counted
-    :param pixel_parser: get one value from RGBA channels
+    :param pixel_parser: get one value from RGBA channels for all pixels
     :return: count of pixel brighter or equal than threshold
     """
-    assert detection.get(IMAGE) is not None
-
-    hit_img = detection.get(IMAGE)
-    width, height = hit_img.size
+    histogram = get_stored_histogram(detection, pixel_parser)
+    if histogram is not None:
+        bright_count = int(histogram[histogram_index(threshold):].sum())
+    else:
+        brightness = get_brightness_array(detection, pixel_parser)
+        bright_count = int(np.count_nonzero(brightness >= threshold))
 
-    bright_count = 0
-    for cy in range(height):
-        for cx in range(width):
-            g = pixel_parser(hit_img.getpixel((cx, cy)))
-            if g >= threshold:
-                bright_count += 1
     detection[BRIGHTER_COUNT % threshold] = bright_count
     return bright_count
 
 
-def detection_load_parser(detection: dict):
+def count_of_brightest_pixels_for_thresholds(detection: dict, thresholds: Iterable[int], pixel_parser: ArrayParser = get_brightest_channel_array) -> Dict[int, int]:
+    """
+    Count pixels brighter than each of thresholds in one pass. Using pixel_parser for get pixel value.
+    Set values to 'image_brighter_count_{threshold}' fields and return.
+
+    When histogram is stored by ``get_brightness_histogram()`` then counts are read from its reverse cumulative sum.
+    Otherwise pixel values are sorted once and count for each threshold is found by binary search.
+    :param detection: detection with 'image' field
+    :param thresholds: list of thresholds, see: ``count_of_brightest_pixels()``
+    :param pixel_parser: get one value from RGBA channels for all pixels
+    :return: dict with threshold as key and count of pixel brighter or equal than threshold as value
+    """
+    thresholds = list(thresholds)
+    histogram = get_stored_histogram(detection, pixel_parser)
+    if histogram is not None:
+        counts = get_brighter_counts(histogram)[[histogram_index(t) for t in thresholds]]
+    else:
+        brightness = np.sort(get_brightness_array(detection, pixel_parser), axis=None)
+        counts = brightness.size - np.searchsorted(brightness, thresholds, side='left')
+
+    ret = {}
+    for threshold, bright_count in zip(thresholds, counts.tolist()):
+        detection[BRIGHTER_COUNT % threshold] = bright_count
+        ret[threshold] = bright_count
+    return ret
+
+
+def measure_image_stats(detection: dict, thresholds: Iterable[int] = (), pixel_parser: ArrayParser = get_brightest_channel_array) -> Tuple[int, int]:
+    """
+    Measure darkness, brightest and count of pixels brighter than thresholds
+    with only one conversion of image to array.
+
+    See: ``measure_darkness_brightest()`` and ``count_of_brightest_pixels_for_thresholds()``.
+    :param detection: detection with 'image' field
+    :param thresholds: list of thresholds for count of brighter pixels
+    :param pixel_parser: get one value from RGBA channels for all pixels
+    :return: tuple of darkness and brightest
+    """
+    ret = measure_darkness_brightest(detection, pixel_parser)
+    count_of_brightest_pixels_for_thresholds(detection, thresholds, pixel_parser)
+    return ret
+
+
+def detection_load_parser(detection: dict, cache: Optional[ImageCache] = None):
     if not detection.get(FRAME_CONTENT):
         return False
-    load_image(detection)
+    load_image(detection, cache)
+    decode_frame_content(detection)
     return True
+
+
+def release_images(detections: List[dict]) -> None:
+    """
+    Close PIL images loaded by ``load_image()`` (and replaced by reconstruction) for memory free.
+    :param detections: list of detections
+    """
+    for d in detections:
+        for key in [IMAGE, ORIG_IMAGE]:
+            img = d.pop(key, None)
+            if img is not None:
+                img.close()
+        release_brightness_array(d)
+
+
+def pack_image(image: Image) -> Tuple[str, Tuple[int, int], bytes]:
+    """
+    Convert image to raw bytes, cheaper to send to other process than pickled PIL image.
+    :param image: PIL image
+    :return: tuple of mode, size and raw bytes
+    """
+    return image.mode, image.size, image.tobytes()
+
+
+def unpack_image(packed: Tuple[str, Tuple[int, int], bytes]) -> Image:
+    """
+    Reverse of ``pack_image()``.
+    """
+    return Image.frombytes(*packed)
+
+
+# keys not sent to other process: images are packed separately, the content of crop is not required by analysis
+PACK_EXCLUDE = {IMAGE, ORIG_IMAGE, IMAGE_BRIGHTNESS, FRAME_CONTENT, FRAME_DECODED}
+
+
+def pack_detection(detection: dict, with_image: bool = True) -> dict:
+    """
+    Copy of detection without image objects, cached arrays and content of crop (``frame_content`` and ``frame_decoded``).
+    :param detection: detection
+    :param with_image: image will be included in ``image`` key packed by ``pack_image()``
+    :return: packed copy of detection
+    """
+    ret = {k: v for k, v in detection.items() if k not in PACK_EXCLUDE}
+    if with_image and detection.get(IMAGE) is not None:
+        ret[IMAGE] = pack_image(detection.get(IMAGE))
+    return ret
+
+
+def unpack_detection(packed: dict) -> dict:
+    """
+    Reverse of ``pack_detection()``.
+    """
+    ret = dict(packed)
+    if packed.get(IMAGE) is not None:
+        ret[IMAGE] = unpack_image(packed.get(IMAGE))
+    return ret
+
+
+def pack_changes(before: dict, after: dict) -> Tuple[dict, List[str]]:
+    """
+    Keys of detection changed by analysis, to send back from other process only them.
+
+    Values are compared by identity, so only keys set by analysis are included.
+    The image is included (packed by ``pack_image()``) only when was replaced, i.e. by reconstruction.
+    :param before: shallow copy of detection made before analysis
+    :param after: detection after analysis
+    :return: tuple of (changed keys with values, removed keys), see: ``merge_detection()``
+    """
+    skip = {ORIG_IMAGE, IMAGE_BRIGHTNESS}
+    changed = {}
+    for k, v in after.items():
+        if k in skip or (k in before and before[k] is v):
+            continue
+        changed[k] = pack_image(v) if k == IMAGE and v is not None else v
+    removed = [k for k in before.keys() if k not in after and k not in skip]
+    return changed, removed
+
+
+def merge_detection(detection: dict, packed: dict, removed: Optional[List[str]] = None) -> None:
+    """
+    Update detection by values from detection packed by ``pack_detection()`` or changes from ``pack_changes()``.
+    When packed detection contains image, then it replaces image like by reconstruction (the old one is moved to ``orig_image``).
+    :param detection: detection to update
+    :param packed: packed detection
+    :param removed: keys to remove from detection
+    """
+    for k, v in packed.items():
+        if k == IMAGE:
+            detection[ORIG_IMAGE] = detection.get(IMAGE)
+            detection[IMAGE] = unpack_image(v)
+        else:
+            detection[k] = v
+    for k in removed or []:
+        detection.pop(k, None)
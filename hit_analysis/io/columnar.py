@@ -0,0 +1,151 @@
+import os
+import pickle
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+BLOB_SUFFIX = '.blob'
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def is_int64(v: Any) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool) and INT64_MIN <= v <= INT64_MAX
+
+
+def get_value_type(v: Any) -> str:
+    """
+    Name of type of value used for column split in columnar format.
+    :param v: value from detection
+    :return: name of type, ``pickle`` when type is not supported by columns
+    """
+    if v is None:
+        return 'none'
+    if isinstance(v, bool):
+        return 'bool'
+    if is_int64(v):
+        return 'int'
+    if isinstance(v, float):
+        return 'float'
+    if isinstance(v, str):
+        return 'str'
+    if isinstance(v, bytes):
+        return 'bytes'
+    if isinstance(v, tuple):
+        if all(is_int64(e) for e in v):
+            return 'tuple%d' % len(v)
+        if all(isinstance(e, float) for e in v):
+            return 'ftuple%d' % len(v)
+    if isinstance(v, np.ndarray) and not v.dtype.hasobject:
+        return 'ndarray-%s-%s' % (v.dtype.str.replace('|', '='), 'x'.join(map(str, v.shape)))  # '|' is separator of array names
+    if isinstance(v, Image.Image):
+        return 'image'
+    return 'pickle'
+
+
+def write_columnar(output_file: str, obj_list: List[dict]) -> None:
+    """
+    Save detections in columnar format.
+
+    Two files are written:
+      * ``output_file``: NumPy ``.npz`` archive (without pickle) with one array per key and type of value,
+        i.e. ``x|int|idx`` with indexes of objects and ``x|int|val`` with values.
+      * ``output_file + '.blob'``: raw content of ``bytes`` values, UTF-8 encoded ``str`` values
+        and raw RGBA pixels of PIL images, the ``val`` array of these columns contains offset and size in blob.
+
+    Tuples of ints and of floats are stored in 2D arrays of int64 and float64.
+    Values of other types (i.e. lists, dicts, tuples of mixed types) are pickled to blob.
+
+    :param output_file: path to file when data will be stored
+    :param obj_list: list of object to store
+    """
+    columns = {}  # type: Dict[Tuple[str, str], Tuple[List[int], List[Any]]]
+    for i, o in enumerate(obj_list):
+        for k, v in o.items():
+            t = get_value_type(v)
+            idx, vals = columns.setdefault((k, t), ([], []))
+            idx.append(i)
+            vals.append(v)
+
+    arrays = {'count': np.array(len(obj_list))}
+    offset = 0
+    with open(output_file + BLOB_SUFFIX, 'wb') as blob:
+        for (k, t), (idx, vals) in columns.items():
+            name = '%s|%s|' % (k, t)
+            arrays[name + 'idx'] = np.array(idx, dtype=np.int64)
+            if t == 'none':
+                continue
+            elif t in ('bytes', 'str', 'pickle'):
+                val = []
+                for v in vals:
+                    v = v.encode() if t == 'str' else pickle.dumps(v) if t == 'pickle' else v
+                    blob.write(v)
+                    val.append((offset, len(v)))
+                    offset += len(v)
+                arrays[name + 'val'] = np.array(val, dtype=np.int64).reshape((-1, 2))
+            elif t == 'image':
+                val = []
+                for v in vals:
+                    data = v.convert('RGBA').tobytes() if v.mode != 'RGBA' else v.tobytes()
+                    blob.write(data)
+                    val.append((offset, *v.size))
+                    offset += len(data)
+                arrays[name + 'val'] = np.array(val, dtype=np.int64).reshape((-1, 3))
+            elif t.startswith('ndarray'):
+                arrays[name + 'val'] = np.stack(vals)
+            elif t.startswith('tuple') or t.startswith('ftuple'):
+                size = int(t[t.index('tuple') + 5:])
+                arrays[name + 'val'] = np.array(vals, dtype=np.int64 if t.startswith('tuple') else np.float64).reshape((len(vals), size))
+            else:
+                arrays[name + 'val'] = np.array(vals)
+
+    with open(output_file, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def read_columnar(input_file: str) -> List[dict]:
+    """
+    Load data stored by ``write_columnar()``.
+
+    PIL images are mapped directly to memory-mapped blob file (without copy),
+    so pixels are read from disk when are used.
+
+    :param input_file: path to file when data was stored by write_columnar()
+    :return: list of objects
+    """
+    with np.load(input_file, allow_pickle=False) as npz:
+        arrays = {k: npz[k] for k in npz.files}
+
+    blob_file = input_file + BLOB_SUFFIX
+    blob = np.memmap(blob_file, dtype=np.uint8, mode='r') if os.path.getsize(blob_file) else np.zeros(0, dtype=np.uint8)
+
+    ret = [{} for i in range(int(arrays.pop('count')))]
+    for name, idx in arrays.items():
+        if not name.endswith('|idx'):
+            continue
+        k, t, _ = name.rsplit('|', 2)
+        idx = idx.tolist()
+        val = arrays.get('%s|%s|val' % (k, t))
+
+        if t == 'none':
+            vals = [None] * len(idx)
+        elif t == 'bytes':
+            vals = [blob[o:o + s].tobytes() for o, s in val.tolist()]
+        elif t == 'str':
+            vals = [blob[o:o + s].tobytes().decode() for o, s in val.tolist()]
+        elif t == 'pickle':
+            vals = [pickle.loads(blob[o:o + s].tobytes()) for o, s in val.tolist()]
+        elif t == 'image':
+            vals = [Image.frombuffer('RGBA', (w, h), blob[o:o + w * h * 4], 'raw', 'RGBA', 0, 1) for o, w, h in val.tolist()]
+        elif t.startswith('tuple') or t.startswith('ftuple'):
+            vals = [tuple(v) for v in val.tolist()]
+        elif t.startswith('ndarray'):
+            vals = list(val)
+        else:
+            vals = val.tolist()
+
+        for i, v in zip(idx, vals):
+            ret[i][k] = v
+    return ret
@@ -1,16 +1,148 @@
 import csv
-from typing import List
+import io
+from itertools import islice
+from typing import List, Tuple, Iterable, Optional, Pattern
 
+from hit_analysis.commons.consts import ID, DEVICE_ID, TIMESTAMP, WIDTH, HEIGHT, X, Y, USER_ID, TEAM_ID, TIME_RECEIVED, LATITUDE, LONGITUDE, \
+    ALTITUDE, ACCURACY, PROVIDER, SOURCE, METADATA, DARKNESS, BRIGHTEST, BRIGHTER_COUNT_USED, BRIGHTER_COUNT_THRESHOLD, EDGE, CROP_X, CROP_Y, \
+    CROP_SIZE, CLASSIFIED, ARTIFACT_TOO_OFTEN, ARTIFACT_HOT_PIXEL, ARTIFACT_NEAR_HOT_PIXEL, ARTIFACT_NEAR_HOT_PIXEL_REFXY, ARTIFACT_TOO_DARK, \
+    ARTIFACT_TOO_LARGE_BRIGHT_AREA, ARTIFACT_NEAR_HOT_PIXEL2
 
-def to_str(v: any):
-    if v is None:
-        return ''
-    return str(v)
+
+CsvColumns = List[Tuple[str, int]]
+
+
+# columns of detection in CSV: (key, count of CSV columns), count is greater than 1 for tuples
+DETECTION_CSV_COLUMNS = sorted([
+    (ID, 1), (DEVICE_ID, 1), (USER_ID, 1), (TEAM_ID, 1), (TIMESTAMP, 1), (TIME_RECEIVED, 1),
+    (WIDTH, 1), (HEIGHT, 1), (X, 1), (Y, 1),
+    (LATITUDE, 1), (LONGITUDE, 1), (ALTITUDE, 1), (ACCURACY, 1), (PROVIDER, 1), (SOURCE, 1), (METADATA, 1),
+    (DARKNESS, 1), (BRIGHTEST, 1), (BRIGHTER_COUNT_USED, 1), (BRIGHTER_COUNT_THRESHOLD, 1),
+    (EDGE, 1), (CROP_X, 1), (CROP_Y, 1), (CROP_SIZE, 2),
+    (CLASSIFIED, 1),
+    (ARTIFACT_TOO_OFTEN, 1), (ARTIFACT_HOT_PIXEL, 1), (ARTIFACT_NEAR_HOT_PIXEL, 1), (ARTIFACT_NEAR_HOT_PIXEL_REFXY, 2),
+    (ARTIFACT_TOO_DARK, 1), (ARTIFACT_TOO_LARGE_BRIGHT_AREA, 1), (ARTIFACT_NEAR_HOT_PIXEL2, 1),
+])  # type: CsvColumns
+
+
+CSV_CHUNK_SIZE = 1000
+CSV_DISCOVER_ROWS = 1000  # count of first rows scanned for keys out of fixed columns, see: CsvWriter.add_columns()
+
+
+class CsvWriter:
+    """
+    CSV writer with fixed columns.
+
+    The header and exclusions are compiled once in constructor, so values of rows are only picked by keys.
+    Rows are written to file in chunks of ``chunk_size`` rows.
+
+    Keys of objects out of columns are not written, unless they are added by ``add_columns()`` before header.
+
+    Example::
+
+      with open('output.csv', 'w', newline='') as csvfile:
+          writer = CsvWriter(csvfile, exclude={FRAME_CONTENT})
+          writer.add_columns(detections)
+          writer.write_header()
+          writer.write(detections)
+
+    :param csvfile: file stream to output in CSV format
+    :param columns: list of (key, count of CSV columns), default: DETECTION_CSV_COLUMNS
+    :param exclude: exclude columns
+    :param regex_exclude: exclude columns regex
+    :param chunk_size: count of rows written to csvfile at once
+    """
+
+    def __init__(self, csvfile, columns: Optional[CsvColumns] = None, exclude: Optional[set] = None,
+                 regex_exclude: Optional[List[Pattern]] = None, chunk_size: int = CSV_CHUNK_SIZE):
+        self.exclude = exclude or set()
+        self.regex_exclude = regex_exclude or []
+        self.known = set()
+        self.columns = []  # type: CsvColumns
+        self.header = []  # type: List[str]
+
+        self.csvfile = csvfile
+        self.chunk_size = chunk_size
+        self.set_columns(DETECTION_CSV_COLUMNS if columns is None else columns)
+
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def set_columns(self, columns: CsvColumns) -> None:
+        self.known.update(k for k, count in columns)
+        self.columns = [(k, count) for k, count in columns if k not in self.exclude and not any(r.match(k) for r in self.regex_exclude)]
+        self.header = []
+        for k, count in self.columns:
+            self.header.append(k)
+            self.header.extend([''] * (count - 1))
+
+    def add_columns(self, objects: Iterable[dict]) -> None:
+        """
+        Add columns for keys of objects out of columns (i.e. custom fields of input JSON) and sort all columns by key,
+        like ``gen_csv_header()``: only keys with trivial or tuple values, tuples take max count of its values.
+        Must be called before ``write_header()``.
+        :param objects: objects to scan
+        """
+        counts = {}
+        for o in objects:
+            for k, v in o.items():
+                if k in self.known:
+                    continue
+                if isinstance(v, tuple):
+                    counts[k] = max(counts.get(k, 1), len(v))
+                elif isinstance(v, (str, int, float)):
+                    counts.setdefault(k, 1)
+        if len(counts):
+            self.set_columns(sorted(self.columns + list(counts.items())))
+
+    def make_row(self, o: dict) -> list:
+        """
+        Values of CSV columns, None is written as empty column.
+        :param o: object to write
+        :return: list of values
+        :raise ValueError: when tuple has more values than its CSV columns
+        """
+        row = []
+        for k, count in self.columns:
+            v = o.get(k)
+            if count == 1:
+                row.append(v)
+            else:
+                v = v or ()
+                if len(v) > count:
+                    raise ValueError('%s has %d values, but %d CSV columns' % (k, len(v), count))
+                row.extend(v)
+                row.extend([None] * (count - len(v)))
+        return row
+
+    def flush(self) -> None:
+        self.csvfile.write(self.buffer.getvalue())
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def write_header(self) -> None:
+        self.writer.writerow(self.header)
+        self.flush()
+
+    def write(self, objects: Iterable[dict]) -> None:
+        """
+        Write objects to CSV, may be called many times, i.e. for each group of analysed detections.
+        :param objects: objects to write
+        """
+        it = iter(objects)
+        while True:
+            chunk = list(islice(it, self.chunk_size))
+            if not chunk:
+                break
+            self.writer.writerows(map(self.make_row, chunk))
+            self.flush()
 
 
 def gen_csv_header(objects: List[dict]) -> dict:
     """
     Make options for CVS export.
+
+    Note: scan all keys of all objects, use ``CsvWriter`` with fixed columns when columns are known.
     :param objects: parsed objects to analyse.
     :return: key: column name, value:
     - type: trivial or tuple
@@ -38,48 +170,13 @@ def write_to_csv(csvfile, objects: List[dict], options: dict = None, header: Lis
     :param exclude: exclude columns
     :param regex_exclude: exclude columns regex
     """
-    writer = csv.writer(csvfile)
-    _header = header or sorted(options.keys())
     _options = options or {}
-    _exclude = exclude or set()
-    _regex_exclude = regex_exclude or []
-
-    def in_exclude(col: str):
-        if col in _exclude:
-            return True
-        for r in _regex_exclude:
-            if r.match(col):
-                return True
-        return False
-
-    header_row = []
+    _header = header or sorted(_options.keys())
+    columns = []
     for h in _header:
-        if in_exclude(h):
-            continue
-
         opt = _options.get(h, {})
-        header_row.append(h)
-        if opt.get('type') == 'tuple':
-            for i in range(1, opt.get('count', 1)):
-                header_row.append('')
-    writer.writerow(header_row)
+        columns.append((h, opt.get('count', 1) if opt.get('type') == 'tuple' else 1))
 
-    for o in objects:
-        row = []
-        for h in _header:
-            if in_exclude(h):
-                continue
-
-            opt = _options.get(h, {})
-            _type = opt.get('type', 'trivial')
-            count = opt.get('count', 1)
-            v = o.get(h)
-            if _type == 'trivial':
-                row.append(to_str(v))
-            elif _type == 'tuple':
-                v = v or ()
-                for t in v:
-                    row.append(to_str(t))
-                for i in range(len(v), count):
-                    row.append('')
-        writer.writerow(row)
+    writer = CsvWriter(csvfile, columns, exclude, regex_exclude)
+    writer.write_header()
+    writer.write(objects)
@@ -0,0 +1,90 @@
+import os
+from hashlib import sha1
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from hit_analysis.commons.consts import ID, FRAME_CONTENT, FRAME_DECODED
+
+
+class ImageCache:
+    """
+    On-disk cache of decoded images stored as ``.npy`` files with RGBA arrays.
+
+    The file name is made from detection ID and hash of ``frame_content``, so changed content is not loaded from cache.
+    When size of all files is larger than ``max_size`` then the least recently used files are removed.
+
+    Example::
+
+      cache = ImageCache('/tmp/credo_cache', 1024 * 1024 * 1024)
+      objects, count = load_json(input_file, partial(progress_and_process_image, cache=cache))
+    """
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        """
+        Initialize cache, the directory will be created when not exists.
+        :param directory: directory for cached files
+        :param max_size: max size of all cached files in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(e.stat().st_size for e in os.scandir(directory) if e.name.endswith('.npy'))
+
+    def get_path(self, detection: dict) -> str:
+        """
+        Path to cached file for detection.
+        :param detection: detection with ``id`` and ``frame_content`` or ``frame_decoded``
+        :return: path to .npy file
+        """
+        content = detection.get(FRAME_CONTENT)
+        content = str.encode(content) if content else detection.get(FRAME_DECODED)
+        return os.path.join(self.directory, '%d_%s.npy' % (detection.get(ID), sha1(content).hexdigest()))
+
+    def load(self, detection: dict) -> Optional[Image.Image]:
+        """
+        Load image from cache.
+        :param detection: detection with ``id`` and ``frame_content`` or ``frame_decoded``
+        :return: RGBA image or None when is not cached
+        """
+        path = self.get_path(detection)
+        try:
+            pixels = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # mark as recently used
+        return Image.fromarray(np.ascontiguousarray(pixels), 'RGBA')
+
+    def store(self, detection: dict, image: Image.Image) -> None:
+        """
+        Store image in cache and remove the least recently used files when cache is too large.
+        :param detection: detection with ``id`` and ``frame_content`` or ``frame_decoded``
+        :param image: RGBA image
+        """
+        path = self.get_path(detection)
+        tmp_path = '%s.tmp' % path
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(image, dtype=np.uint8))
+        try:
+            self.size -= os.path.getsize(path)  # overwritten file is already counted
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        self.size += os.path.getsize(path)
+
+        if self.size > self.max_size:
+            self.evict(self.max_size * 9 // 10)
+
+    def evict(self, size: int) -> None:
+        """
+        Remove the least recently used files until size of cache is not larger than size param.
+        :param size: expected size of cache in bytes
+        """
+        entries = sorted((e for e in os.scandir(self.directory) if e.name.endswith('.npy')), key=lambda e: e.stat().st_mtime)
+        self.size = sum(e.stat().st_size for e in entries)
+        for e in entries:
+            if self.size <= size:
+                break
+            self.size -= e.stat().st_size
+            os.remove(e.path)
@@ -6,6 +6,7 @@ from typing import List, Optional
 from PIL import Image
 
 from hit_analysis.commons.consts import FRAME_CONTENT, ID, FRAME_DECODED
+from hit_analysis.io.image_cache import ImageCache
 
 
 def decode_base64(frame_content: str) -> bytes:
@@ -49,11 +50,13 @@ def progress_load_filter(obj: dict, count: int, ret: List[dict]) -> Optional[boo
     return True
 
 
-def progress_and_process_image(obj: dict, count: int, ret: List[dict]) -> Optional[bool]:
+def progress_and_process_image(obj: dict, count: int, ret: List[dict], cache: Optional[ImageCache] = None) -> Optional[bool]:
     """
     Notify progress to ``stdout`` after each 10000 parsed objects and load images from ``frame_content``.
     Objects without image will be ignored.
 
+    The optional ``cache`` of decoded images may be bound by ``functools.partial()``.
+
     See ``progress_load_filter()`` for progress notification
     and ``load_image()`` for more info about new keys added to object.
 
@@ -68,12 +71,12 @@ def progress_and_process_image(obj: dict, count: int, ret: List[dict]) -> Option
 
     try:
         from hit_analysis.image.image_utils import load_image
-        load_image(obj)
+        load_image(obj, cache)
     except Exception as e:
         print('Fail of load image in object with ID: %d, error: %s' % (obj.get(ID), str(e)), file=sys.stderr)
         return False
 
     obj.pop(FRAME_CONTENT)
-    obj.pop(FRAME_DECODED)
+    obj.pop(FRAME_DECODED, None)
 
     return True
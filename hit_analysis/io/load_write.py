@@ -1,17 +1,104 @@
-import pickle
+import re
 import sys
-from typing import List, TextIO, Callable, Optional, Tuple
+from typing import List, TextIO, Callable, Optional, Tuple, Iterator
 
-from json import loads
-from io import StringIO
+from json import JSONDecoder, JSONDecodeError
+
+from hit_analysis.commons.config import Config
+from hit_analysis.io.columnar import write_columnar, read_columnar
 
 
 LoadJsonCallback = Callable[[dict, int, List[dict]], Optional[bool]]
+ObjectParser = Callable[[dict], bool]
+
+JSON_CHUNK_SIZE = 1 << 20
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+JSON_MAX_TOKEN = 10  # longer than the longest literal (-Infinity) which may be cut by the end of buffer
+
+
+def is_truncated_json(e: JSONDecodeError, length: int) -> bool:
+    """
+    Check if decode error may be caused by the end of buffer in the middle of object.
+
+    It is true for not terminated string (the decoder stops at control char like newline in broken string)
+    or when error is in the last token of buffer. Otherwise the next chunk can not fix the error.
+
+    :param e: error raised by ``JSONDecoder.raw_decode()``
+    :param length: length of decoded buffer
+    :return: True when reading of next chunk may fix the error
+    """
+    return e.msg.startswith('Unterminated string') or e.pos > length - JSON_MAX_TOKEN
+
+
+def iter_json_from_stream(_input: TextIO, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Generator of objects from the first array in JSON.
+
+    Example::
+      for obj in iter_json_from_stream(sys.stdin):
+        ...
+
+    How it works:
+      1. Read input in chunks of ``chunk_size`` chars and ignore all chars until ``'['``
+      2. Parse next object from buffer by ``JSONDecoder.raw_decode()`` from stdlib,
+         when object is not complete in buffer then read next chunk and try again.
+         Syntax error before the end of buffer is raised immediately.
+      3. Yield parsed object and go to 2. until ``']'``
+
+    Only one object and at most one chunk is stored in memory at once. Nested objects are supported.
+
+    :param _input: input text stream with JSON content
+    :param chunk_size: count of chars read from input at once
+    :return: iterator over parsed objects
+    """
+    decoder = JSONDecoder()
+    buff = ''
+    pos = -1
+    eof = False
+
+    while pos < 0:
+        buff = _input.read(chunk_size)
+        if not buff:
+            return
+        pos = buff.find('[')
+    pos += 1
+
+    while True:
+        pos = JSON_SEPARATORS.match(buff, pos).end()
+        if pos == len(buff) or not eof and len(buff) - pos < chunk_size // 2:
+            chunk = _input.read(chunk_size)
+            eof = not chunk
+            buff = buff[pos:] + chunk
+            pos = 0
+            if not buff:
+                return
+            continue
+
+        if buff[pos] == ']':
+            return
+
+        try:
+            o, end = decoder.raw_decode(buff, pos)
+        except JSONDecodeError as e:
+            if eof or not is_truncated_json(e, len(buff)):
+                raise
+            end = len(buff)
+
+        if end == len(buff) and not eof:
+            # object may be not complete, try again with next chunk
+            chunk = _input.read(chunk_size)
+            eof = not chunk
+            buff = buff[pos:] + chunk
+            pos = 0
+            continue
+
+        yield o
+        pos = end
 
 
 def load_json_from_stream(_input: TextIO, _filter: Optional[LoadJsonCallback] = None) -> Tuple[List[dict], int]:
     """
-    Extract flat objects from array in JSON.
+    Extract objects from array in JSON.
 
     Example::
       objects, count = load_json_from_stream(os.stdin, progress_load_filter)
@@ -28,18 +115,7 @@ def load_json_from_stream(_input: TextIO, _filter: Optional[LoadJsonCallback] =
         ...]
       }
 
-    How it works:
-      1. Ignore all chars until ``'['``
-      2. Extract string between next ``'{'`` and following ``'}'`` by:
-
-         a) Ignore all chars until ``'{'``
-         b) Copy all chars until ``'}'``
-
-      3. Parse extracted string by JSON parser from stdlib.
-      4. Execute filter if is not None, when is None or return True then append object to return list
-      5. Go to 2. until ``']'``
-
-    Note: depth of ``'{'`` was ignored, only flat object are supported
+    Objects are parsed by ``iter_json_from_stream()``.
 
     :param _input: input text stream with JSON content
     :type _input: TextIO
@@ -68,48 +144,47 @@ def load_json_from_stream(_input: TextIO, _filter: Optional[LoadJsonCallback] =
     ret = []
     count = 0
 
-    stage = 0
-    buff = None
-    for line in _input:
-        done = False
-        for a in line:
-            if stage == 0:
-                if a == '[':
-                    stage = 1
-                    continue  # and read next character
-            if stage == 1:
-                if a == ']':
-                    done = True
-                    break
-                if a == '{':
-                    buff = StringIO()
-                    stage = 2  # and continue parsing this character in stage 2
-            if stage == 2:
-                if a == '}':
-                    buff.write(a)
-                    o = loads(buff.getvalue())
-                    buff.close()
-                    buff = None
-
-                    count += 1
-                    if filter is None:
-                        ret.append(o)
-                    else:
-                        fr = _filter(o, count, ret)
-                        if fr is None:
-                            done = True
-                            break
-                        elif fr:
-                            ret.append(o)
-                    stage = 1
-                else:
-                    buff.write(a)
-        if done:
-            break
+    for o in iter_json_from_stream(_input):
+        count += 1
+        if _filter is None:
+            ret.append(o)
+        else:
+            fr = _filter(o, count, ret)
+            if fr is None:
+                break
+            elif fr:
+                ret.append(o)
 
     return ret, count
 
 
+def load_objects_from_stream(_input: TextIO, config: Config, parser: Optional[ObjectParser] = None) -> List[dict]:
+    """
+    Load objects from array in JSON with progress notification by ``config.print_log()``.
+
+    Example::
+      objects = load_objects_from_stream(sys.stdin, config, detection_load_parser)
+
+    :param _input: input text stream with JSON content, see: ``iter_json_from_stream()``
+    :param config: config object used for print logs
+    :param parser: optional callback executed on each object, when return False then object will be ignored
+    :return: list of loaded objects
+    """
+    timing = config.print_log('Load objects...')
+    ret = []
+    count = 0
+
+    for o in iter_json_from_stream(_input):
+        count += 1
+        if parser is None or parser(o):
+            ret.append(o)
+        if count % 10000 == 0:
+            config.print_log('... just parsed %d and skip %d objects.' % (count, count - len(ret)))
+
+    config.print_log('... loaded %d objects, skip %d objects' % (len(ret), count - len(ret)), timing)
+    return ret
+
+
 def load_json(input_file: str, *args, **kwargs) -> Tuple[List[dict], int]:
     """
     Wrapper on ``load_json_from_stream()``.
@@ -134,22 +209,22 @@ def load_json(input_file: str, *args, **kwargs) -> Tuple[List[dict], int]:
 
 def serialize(output_file: str, obj_list: List[dict]) -> None:
     """
-    Save data to binary file.
+    Save data to binary files in columnar format.
 
-    Note: please refer to ``pickle`` module limitations.
-    :param output_file: path to file when data will be stored
+    Note: values of simple types, tuples of numbers, NumPy arrays and PIL images are stored in columns,
+    values of other types are pickled, see: ``write_columnar()``.
+    :param output_file: path to file when data will be stored, the crops will be stored in ``output_file + '.blob'``
     :param obj_list: list of object to store
     """
-    with open(output_file, 'wb') as f:
-        pickle.dump(obj_list, f)
+    write_columnar(output_file, obj_list)
 
 
 def deserialize(input_file: str) -> List[dict]:
     """
     Load data stored by ``serialize()``.
 
+    The images are memory-mapped from blob file, see: ``read_columnar()``.
     :param input_file: path to file when data was stored by serialize()
     :return: list of objects
     """
-    with open(input_file, "rb") as f:
-        return pickle.load(f)
+    return read_columnar(input_file)
@@ -0,0 +1,66 @@
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+from hit_analysis.commons.utils import get_and_set
+
+
+def flush_partitions(buffered: Dict[Any, List[dict]], paths: Dict[Any, str], directory: str) -> None:
+    """
+    Append buffered objects to partition files and clear the buffer.
+    :param buffered: objects grouped by partition key, will be cleared
+    :param paths: paths of partition files, new paths will be added
+    :param directory: directory for partition files
+    """
+    for key, objects in buffered.items():
+        path = paths.get(key)
+        if path is None:
+            path = os.path.join(directory, '%05d.ndjson' % len(paths))
+            paths[key] = path
+        with open(path, 'a') as f:
+            for o in objects:
+                f.write(json.dumps(o))
+                f.write('\n')
+    buffered.clear()
+
+
+def partition_objects(objects: Iterable[dict], func: Callable[[dict], Any], directory: str, buffer_size: int = 10000) -> Dict[Any, str]:
+    """
+    Split stream of objects to files (one JSON object per line) by key generated by func.
+
+    Example::
+
+      partitions = partition_objects(iter_json_from_stream(sys.stdin), lambda x: x.get(DEVICE_ID), '/tmp/partitions')
+      for device_id, path in partitions.items():
+        detections = list(load_partition(path))
+
+    Only ``buffer_size`` objects are stored in memory at once, so whole input may be larger than memory.
+
+    :param objects: iterable of objects, i.e. ``iter_json_from_stream()``
+    :param func: give object as param and return key of partition
+    :param directory: directory for partition files, should be empty
+    :param buffer_size: count of objects buffered in memory before append to partition files
+    :return: dict of partition key and path to partition file
+    """
+    paths = {}
+    buffered = {}
+    count = 0
+    for o in objects:
+        get_and_set(buffered, func(o), []).append(o)
+        count += 1
+        if count >= buffer_size:
+            flush_partitions(buffered, paths, directory)
+            count = 0
+    flush_partitions(buffered, paths, directory)
+    return paths
+
+
+def load_partition(path: str) -> Iterator[dict]:
+    """
+    Load objects stored by ``partition_objects()``.
+    :param path: path to partition file
+    :return: iterator over objects
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            yield json.loads(line)
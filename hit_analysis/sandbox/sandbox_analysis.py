@@ -9,7 +9,7 @@ from hit_analysis.commons.consts import FRAME_DECODED, FRAME_CONTENT, DEVICE_ID,
     ARTIFACT_TOO_OFTEN, ARTIFACT_NEAR_HOT_PIXEL2, EDGE, IMAGE, X, WIDTH, Y, HEIGHT, BRIGHTEST, DARKNESS, BRIGHTER_COUNT_USED, CLASSIFIED, CLASS_ARTIFACT
 from hit_analysis.commons.grouping import group_by_resolution, group_by_device_id
 from hit_analysis.commons.utils import get_resolution_key, join_tuple, get_and_set
-from hit_analysis.image.image_utils import count_of_brightest_pixels, get_brightest_channel
+from hit_analysis.image.image_utils import count_of_brightest_pixels, get_brightness_array
 from hit_analysis.io.io_utils import decode_base64
 
 
@@ -75,10 +75,7 @@ def sandbox_analysis(detections: List[dict], config: Config) -> None:
                 # if d.get(BRIGHTER_COUNT_USED) > 2:
                 #     continue
 
-                for cy in range(height):
-                    for cx in range(width):
-                        if get_brightest_channel(hit_img.getpixel((cx, cy))) >= th:
-                            h[rel_y + cy][rel_x + cx] += 1
+                h[rel_y:rel_y + height, rel_x:rel_x + width] += get_brightness_array(d) >= th
 
                 get_and_set(counting, (x, y), [])
                 counting[(x, y)].append(d)
@@ -0,0 +1,258 @@
+import copy
+import io
+import itertools
+import json
+import os
+import pickle
+import re
+from random import Random
+from tempfile import TemporaryDirectory
+from typing import List
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+from hit_analysis.classification.artifact.near_hot_pixel import near_hot_pixel
+from hit_analysis.classification.artifact.near_hot_pixel2 import near_hot_pixel2
+from hit_analysis.classification.artifact.too_often import too_often, count_near_in_window
+from hit_analysis.commons.classify import classify_by_lambda, classify_by_count_in_group
+from hit_analysis.commons.consts import TIMESTAMP, ARTIFACT_TOO_OFTEN, X, Y, ARTIFACT_NEAR_HOT_PIXEL, ARTIFACT_NEAR_HOT_PIXEL_REFXY, \
+    ARTIFACT_NEAR_HOT_PIXEL2, IMAGE, ORIG_IMAGE, FRAME_CONTENT, FRAME_DECODED, IMAGE_HISTOGRAM, CLASSIFIED
+from hit_analysis.commons.utils import point_to_point_distance, get_and_set
+from hit_analysis.image.image_utils import pack_detection, unpack_detection, pack_changes, merge_detection
+from hit_analysis.io.columnar import write_columnar, read_columnar
+from hit_analysis.io.csv_write import CsvWriter, gen_csv_header, write_to_csv
+from hit_analysis.io.image_cache import ImageCache
+from hit_analysis.io.load_write import iter_json_from_stream
+
+
+def random_detections(rnd: Random, count: int, **keys: range) -> List[dict]:
+    """
+    Random detections for comparison of classifier with brute-force reference.
+    :param rnd: random generator
+    :param count: count of detections
+    :param keys: range of random values for each key
+    :return: list of detections
+    """
+    return [{'id': i, **{k: rnd.choice(r) for k, r in keys.items()}} for i in range(count)]
+
+
+def too_often_reference(detections: List[dict], often: int, time_window: int) -> None:
+    timestamps = {d[TIMESTAMP] for d in detections}
+    for d in detections:
+        d[ARTIFACT_TOO_OFTEN] = sum(1 for t in timestamps if t != d[TIMESTAMP] and abs(t - d[TIMESTAMP]) < time_window)
+    classify_by_lambda(detections, lambda x: x.get(ARTIFACT_TOO_OFTEN) >= often)
+
+
+def near_hot_pixel_reference(detections: List[dict], often: int, distance: float) -> None:
+    grouped = {}
+    for detection in detections:
+        key_prim = (detection.get(X), detection.get(Y))
+        for key in grouped.keys():
+            if point_to_point_distance(key, key_prim) < distance:
+                key_prim = key
+                break
+        detection[ARTIFACT_NEAR_HOT_PIXEL_REFXY] = key_prim
+        get_and_set(grouped, key_prim, []).append(detection)
+    classify_by_count_in_group(grouped, often, ARTIFACT_NEAR_HOT_PIXEL)
+
+
+def near_hot_pixel2_reference(detections: List[dict], often: int, distance: float) -> None:
+    for d, d_prim in itertools.combinations_with_replacement(detections, 2):
+        get_and_set(d, ARTIFACT_NEAR_HOT_PIXEL2, 0)
+        get_and_set(d_prim, ARTIFACT_NEAR_HOT_PIXEL2, 0)
+        if point_to_point_distance((d.get(X), d.get(Y)), (d_prim.get(X), d_prim.get(Y))) < distance:
+            d[ARTIFACT_NEAR_HOT_PIXEL2] += 1
+            d_prim[ARTIFACT_NEAR_HOT_PIXEL2] += 1
+    classify_by_lambda(detections, lambda x: x.get(ARTIFACT_NEAR_HOT_PIXEL2) >= often)
+
+
+class NearHotPixelTest(TestCase):
+    def compare(self, func, reference):
+        rnd = Random(3)
+        for i in range(200):
+            count = rnd.randint(1, 60)
+            size = rnd.choice([5, 20, 100])
+            distance = rnd.choice([0, 1, 2.5, 5, 7])
+            often = rnd.randint(1, 5)
+            detections = random_detections(rnd, count, x=range(size), y=range(size))
+            expected = copy.deepcopy(detections)
+
+            func(detections, often, distance)
+            reference(expected, often, distance)
+            self.assertEqual(detections, expected)
+
+    def test_near_hot_pixel_random_vs_brute_force(self):
+        self.compare(near_hot_pixel, near_hot_pixel_reference)
+
+    def test_near_hot_pixel2_random_vs_brute_force(self):
+        self.compare(near_hot_pixel2, near_hot_pixel2_reference)
+
+
+class TooOftenTest(TestCase):
+    def test_count_near_in_window(self):
+        self.assertEqual(count_near_in_window([0, 5, 10, 20], 10), [1, 2, 1, 0])
+        self.assertEqual(count_near_in_window([0, 5], 0), [0, 0])
+        self.assertEqual(count_near_in_window([], 10), [])
+
+    def test_random_vs_brute_force(self):
+        rnd = Random(4)
+        for i in range(200):
+            count = rnd.randint(1, 60)
+            time_window = rnd.choice([0, 1, 10, 100, 1000])
+            often = rnd.randint(1, 6)
+            detections = random_detections(rnd, count, timestamp=range(rnd.randint(1, 3000)))
+            expected = copy.deepcopy(detections)
+
+            too_often(detections, often, time_window)
+            too_often_reference(expected, often, time_window)
+            self.assertEqual(detections, expected)
+
+
+class PackDetectionTest(TestCase):
+    def test_round_trip_sends_only_changes(self):
+        image = Image.new('RGBA', (4, 4), (10, 20, 30, 255))
+        detection = {'id': 1, X: 2, Y: 3, IMAGE: image, FRAME_CONTENT: 'YWJj' * 1000, FRAME_DECODED: b'abc' * 1000, IMAGE_HISTOGRAM: 'old'}
+
+        packed = pack_detection(detection)
+        self.assertNotIn(FRAME_CONTENT, packed)
+        self.assertNotIn(FRAME_DECODED, packed)
+
+        # analysis in other process: classify, replace image and crop content (like reconstruction), drop histogram
+        worker = unpack_detection(pickle.loads(pickle.dumps(packed)))
+        before = dict(worker)
+        worker[CLASSIFIED] = 'artifact'
+        worker[ORIG_IMAGE] = worker[IMAGE]
+        worker[IMAGE] = Image.new('RGBA', (4, 4), (200, 200, 200, 255))
+        worker[FRAME_DECODED] = b'new'
+        worker.pop(IMAGE_HISTOGRAM)
+
+        changed, removed = pickle.loads(pickle.dumps(pack_changes(before, worker)))
+        self.assertEqual(set(changed.keys()), {CLASSIFIED, IMAGE, FRAME_DECODED})
+        self.assertEqual(removed, [IMAGE_HISTOGRAM])
+
+        merge_detection(detection, changed, removed)
+        self.assertIs(detection[ORIG_IMAGE], image)
+        self.assertEqual(detection[IMAGE].getpixel((0, 0)), (200, 200, 200, 255))
+        self.assertEqual(detection[FRAME_DECODED], b'new')
+        self.assertEqual(detection[FRAME_CONTENT], 'YWJj' * 1000)
+        self.assertEqual(detection[CLASSIFIED], 'artifact')
+        self.assertNotIn(IMAGE_HISTOGRAM, detection)
+
+    def test_not_changed_image_is_not_sent(self):
+        detection = {'id': 1, IMAGE: Image.new('RGBA', (2, 2))}
+        worker = unpack_detection(pack_detection(detection))
+        changed, removed = pack_changes(dict(worker), worker)
+        self.assertEqual((changed, removed), ({}, []))
+
+
+class CsvWriterTest(TestCase):
+    def write(self, objects: List[dict], **kwargs) -> str:
+        csvfile = io.StringIO()
+        writer = CsvWriter(csvfile, **kwargs)
+        writer.add_columns(objects)
+        writer.write_header()
+        writer.write(objects)
+        return csvfile.getvalue()
+
+    def test_columns(self):
+        objects = [{'id': 1, 'crop': (1, 2), 'skip': 'x'}, {'id': 2, 'crop': None}]
+        content = self.write(objects, columns=[('crop', 2), ('id', 1)], exclude={'skip'}, chunk_size=1)
+        self.assertEqual(content.splitlines(), ['crop,,id', '1,2,1', ',,2'])
+
+    def test_extra_columns_like_gen_csv_header(self):
+        objects = [
+            {'id': 1, 'x': 5, 'custom': 'a', 'pair': (1,), 'image': b'ignored', 'image_brighter_count_010': 3},
+            {'id': 2, 'pair': (3, 4), 'flag': True},
+        ]
+        regex_exclude = [re.compile('image_brighter_count_\\d\\d\\d')]
+        expected = io.StringIO()
+        write_to_csv(expected, objects, gen_csv_header(objects), regex_exclude=regex_exclude)
+
+        self.assertEqual(self.write(objects, columns=[('id', 1), ('x', 1)], regex_exclude=regex_exclude), expected.getvalue())
+
+    def test_too_long_tuple(self):
+        with self.assertRaises(ValueError):
+            self.write([{'crop': (1, 2, 3)}], columns=[('crop', 2), ('id', 1)])
+
+
+class ColumnarTest(TestCase):
+    def test_round_trip(self):
+        objects = [
+            {'id': 1, 'x': 2, 'ratio': 0.5, 'flag': True, 'name': 'zażółć', 'raw': b'\x00\x01', 'xy': (1, 2), 'fxy': (0.5, 1.5),
+             'mixed': (1, 0.5), 'list': [1, 2], 'dict': {'a': (1,)}, 'big': 2 ** 70, 'empty': (), 'none': None,
+             'array': np.arange(4, dtype=np.uint8).reshape((2, 2)), 'image': Image.new('RGBA', (3, 2), (1, 2, 3, 4))},
+            {'id': 2, 'x': 'text', 'xy': (3, 4), 'name': '', 'empty': (), 'a|b': 1},
+            {},
+        ]
+        with TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'objects.npz')
+            write_columnar(path, objects)
+            loaded = read_columnar(path)
+
+            image = loaded[0].pop('image')
+            self.assertEqual(image.tobytes(), objects[0].pop('image').tobytes())
+            array = loaded[0].pop('array')
+            self.assertTrue(np.array_equal(array, objects[0].pop('array')))
+            self.assertEqual(loaded, objects)
+            for o, o_loaded in zip(objects, loaded):
+                self.assertEqual({k: type(v) for k, v in o.items()}, {k: type(v) for k, v in o_loaded.items()})
+                for k in ['xy', 'mixed']:
+                    self.assertEqual([type(e) for e in o.get(k, ())], [type(e) for e in o_loaded.get(k, ())])
+
+
+class ImageCacheTest(TestCase):
+    def test_store_and_evict(self):
+        image = Image.new('RGBA', (4, 4), (1, 2, 3, 4))
+        with TemporaryDirectory() as directory:
+            cache = ImageCache(directory, 10000)
+            detection = {'id': 1, 'frame_content': 'abc'}
+            self.assertIsNone(cache.load(detection))
+
+            cache.store(detection, image)
+            size = cache.size
+            cache.store(detection, image)
+            self.assertEqual(cache.size, size)
+            self.assertEqual(np.asarray(cache.load(detection)).tolist(), np.asarray(image).tolist())
+
+            cache.max_size = size * 5 // 2
+            for i in range(2, 5):
+                cache.store({'id': i, 'frame_content': 'abc'}, image)
+            self.assertEqual(cache.size, size * 2)
+            self.assertEqual(cache.size, ImageCache(directory, cache.max_size).size)
+            self.assertIsNone(cache.load(detection))
+            self.assertIsNotNone(cache.load({'id': 4, 'frame_content': 'abc'}))
+
+
+class IterJsonTest(TestCase):
+    def parse(self, content: str, chunk_size: int) -> List[dict]:
+        return list(iter_json_from_stream(io.StringIO(content), chunk_size))
+
+    def test_random_vs_json_loads(self):
+        rnd = Random(5)
+        for i in range(30):
+            objects = [{
+                'id': j, 'frame_content': 'x' * rnd.randint(0, 40), 'text': rnd.choice(['', ']', '[{', '\\"}', 'zażółć']),
+                'nested': {'list': [{'a': [j, None, True]}] * rnd.randint(0, 3)}, 'x': rnd.random(),
+            } for j in range(rnd.randint(0, 20))]
+            content = json.dumps({'detections': objects}, indent=rnd.choice([None, 2]))
+            for chunk_size in [1, 2, 7, 64, 4096]:
+                self.assertEqual(self.parse(content, chunk_size), objects)
+
+    def test_edge_cases(self):
+        self.assertEqual(self.parse('', 4), [])
+        self.assertEqual(self.parse('{"detections": []}', 4), [])
+        self.assertEqual(self.parse('  [ {"a": 1} ,\n{"b": [2]}  ]  ', 3), [{'a': 1}, {'b': [2]}])
+        self.assertEqual(self.parse('[{"a": 1}, {"b": 2}', 3), [{'a': 1}, {'b': 2}])
+        with self.assertRaises(json.JSONDecodeError):
+            self.parse('[{"a": 1}, {"b": ', 3)
+
+    def test_syntax_error_not_reads_rest(self):
+        tail = ', '.join(['{"a": "%s"}' % ('x' * 50)] * 100) + ']'
+        for broken in ['{"a": x}', '{"a" 1}', '{"a": "b\n"}', '{"a": 1 "b": 2}']:
+            for chunk_size in [1, 7, 64]:
+                _input = io.StringIO('[{"a": 1}, %s, %s' % (broken, tail))
+                with self.assertRaises(json.JSONDecodeError):
+                    list(iter_json_from_stream(_input, chunk_size))
+                self.assertLess(_input.tell(), 40 + 2 * chunk_size)
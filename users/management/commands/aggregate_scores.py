@@ -0,0 +1,34 @@
+import time
+
+from django.core.management import BaseCommand
+
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Fold score events into scores of users, run periodically i.e. by cron or with --interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='count of events aggregated in one transaction', default=10000)
+        parser.add_argument('--interval', type=int, help='when provided then run forever and aggregate events every INTERVAL seconds', default=0)
+        parser.add_argument('--full', action='store_true', help='rebuild scores of all users from classifications and truncate score events before aggregation')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        interval = options['interval']
+
+        if options['full']:
+            print('Rebuilt scores of %d users' % User.rebuild_scores())
+
+        while True:
+            aggregated = 0
+            while True:
+                count = User.aggregate_score_events(batch_size=batch_size)
+                aggregated += count
+                if count < batch_size:
+                    break
+            print('Aggregated %d score events' % aggregated)
+
+            if not interval:
+                break
+            time.sleep(interval)
@@ -1,9 +1,10 @@
 import binascii
 import os
+from typing import Dict, Optional, Tuple
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import Sum, F
+from django.db import models, transaction, connection
+from django.db.models import F, Sum, Q
 from django.utils.translation import gettext_lazy as _
 
 from credo_classification.drf import DjangoPlusViewPermissionsMixin
@@ -15,6 +16,8 @@ class User(AbstractUser):
 
     scores - points gained for classification of cosmic-ray hits (sum of all scores from Score table)
     verified - sum of verified scores from Score table
+
+    Both are updated periodically from ScoreEvent log, see aggregate_score_events().
     """
     team = models.ForeignKey('database.Team', null=True, blank=True, on_delete=models.SET_NULL)
     credo_user = models.ForeignKey('database.CredoUser', null=True, blank=True, on_delete=models.SET_NULL)
@@ -48,22 +51,86 @@ class User(AbstractUser):
 
     def update_scores(self) -> None:
         """
-        Recalc scores from Score table and save.
+        Fold not aggregated score events of user into score and verified.
         """
-        from classify.models import DetectionScore
-        self.score = DetectionScore.objects.filter(user=self).aggregate(score=Sum('score')).get('score', 0)
-        self.verified = DetectionScore.objects.filter(user=self, verified=True).aggregate(verified=Sum('score')).get('verified', 0)
-        self.save()
+        User.aggregate_score_events(user=self)
+        self.refresh_from_db(fields=['score', 'verified'])
 
     def fast_update_scores(self, s: float, v: float) -> None:
+        """
+        Register score diffs in ScoreEvent log, so users_user row is not locked by classification request.
+        The diffs are added to score and verified in DB by aggregate_score_events().
+        """
         self.score += s
         self.verified += v
-        User.objects.filter(username=self.username).update(score=F('score') + s, verified=F('verified') + v)
+        if s or v:
+            ScoreEvent.objects.create(user=self, score=s, verified=v)
+
+    @staticmethod
+    def aggregate_score_events(user: Optional['User'] = None, batch_size: int = 10000) -> int:
+        """
+        Fold batch of score events into score and verified of users and delete them.
+
+        On PostgreSQL the events are locked by FOR UPDATE SKIP LOCKED, so many aggregators may work at once.
+
+        :param user: aggregate events of this user only
+        :param batch_size: max count of events aggregated
+        :return: count of aggregated events
+        """
+        with transaction.atomic():
+            qs = ScoreEvent.objects.order_by('id')
+            if user is not None:
+                qs = qs.filter(user=user)
+            events = list(qs.select_for_update(skip_locked=True).values_list('id', 'user_id', 'score', 'verified')[:batch_size])
+
+            sums = {}  # type: Dict[int, Tuple[float, float]]
+            for _, user_id, s, v in events:
+                us, uv = sums.get(user_id, (0, 0))
+                sums[user_id] = (us + s, uv + v)
+
+            for user_id, (s, v) in sums.items():
+                User.objects.filter(pk=user_id).update(score=F('score') + s, verified=F('verified') + v)
+            ScoreEvent.objects.filter(id__in=[e[0] for e in events]).delete()
+        return len(events)
+
+    @staticmethod
+    def rebuild_scores() -> int:
+        """
+        Recalc score and verified of all users from DetectionScore table and drop all score events,
+        because their diffs are already included in DetectionScore table.
+
+        On PostgreSQL the ScoreEvent table is locked for writes until the end of transaction,
+        so classifications committed during rebuild are registered by their score events after rebuild.
+
+        :return: count of users with scores
+        """
+        from classify.models import DetectionScore
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('LOCK TABLE %s IN EXCLUSIVE MODE' % connection.ops.quote_name(ScoreEvent._meta.db_table))
+            ScoreEvent.objects.all().delete()
+
+            scores = DetectionScore.objects.order_by().values('user_id').annotate(s=Sum('score'), v=Sum('score', filter=Q(verified=True)))
+            users = [User(pk=row['user_id'], score=row['s'], verified=row['v'] or 0) for row in scores]
+            User.objects.update(score=0, verified=0)
+            User.objects.bulk_update(users, ['score', 'verified'], batch_size=1000)
+        return len(users)
 
     class Meta(DjangoPlusViewPermissionsMixin):
         pass
 
 
+class ScoreEvent(models.Model):
+    """
+    Append-only log of score diffs of user, folded into User.score and User.verified by User.aggregate_score_events().
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_("User"))
+    score = models.FloatField(default=0)
+    verified = models.FloatField(default=0)
+    date = models.DateTimeField(auto_now_add=True)
+
+
 class Token(models.Model):
     key = models.CharField(_("Key"), max_length=40, primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_("User"))
@@ -1,3 +1,39 @@
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from classify.models import DetectionScore
+from database.tests import create_detections
+from users.models import User, ScoreEvent
+
+
+class ScoresTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_detections(3)
+
+    def test_aggregate_events(self):
+        user = User.objects.create_user('a')
+        other = User.objects.create_user('b')
+        user.fast_update_scores(2, 1)
+        user.fast_update_scores(1, 0)
+        other.fast_update_scores(4, 4)
+        user.fast_update_scores(0, 0)
+        self.assertEqual(ScoreEvent.objects.count(), 3)
+
+        self.assertEqual(User.aggregate_score_events(batch_size=2), 2)
+        self.assertEqual(User.aggregate_score_events(), 1)
+        self.assertEqual(list(User.objects.order_by('username').values_list('score', 'verified')), [(3, 1), (4, 4)])
+        self.assertFalse(ScoreEvent.objects.exists())
+
+    def test_full_rebuild(self):
+        user = User.objects.create_user('a', score=100, verified=100)
+        other = User.objects.create_user('b', score=5)
+        DetectionScore.objects.create(user=user, detection_id=1, kind='co', score=1, verified=True)
+        DetectionScore.objects.create(user=user, detection_id=2, kind='co', score=2)
+        DetectionScore.objects.create(user=user, detection_id=2, kind='cs', score=3, verified=True)
+        ScoreEvent.objects.create(user=user, score=6, verified=4)
+        ScoreEvent.objects.create(user=other, score=1)
+
+        call_command('aggregate_scores', full=True)
+        self.assertEqual(list(User.objects.order_by('username').values_list('score', 'verified')), [(6, 4), (0, 0)])
+        self.assertFalse(ScoreEvent.objects.exists())
@@ -0,0 +1,50 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum, F
+
+from definitions.models import Attribute
+from values.models import DetectionAttribute, DetectionConsensus
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DetectionConsensus table from all values in DetectionAttribute'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='count of consensus rows inserted in one query', default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        with transaction.atomic():
+            DetectionConsensus.objects.all().delete()
+
+            qs = DetectionAttribute.objects.values('detection_id', 'attribute_id').annotate(
+                c=Count('id'), t=Sum('value'), ts=Sum(F('value') * F('value'))
+            ).order_by('detection_id', 'attribute_id')
+
+            chunk = []
+            inserted = 0
+            detection_ids = set()
+            for row in qs.iterator():
+                chunk.append(DetectionConsensus(
+                    detection_id=row['detection_id'], attribute_id=row['attribute_id'], votes=row['c'], total=row['t'], total_sq=row['ts']
+                ))
+                detection_ids.add(row['detection_id'])
+                if len(chunk) >= chunk_size:
+                    DetectionConsensus.objects.bulk_create(chunk)
+                    inserted += len(chunk)
+                    chunk = []
+            DetectionConsensus.objects.bulk_create(chunk)
+            inserted += len(chunk)
+
+            DetectionConsensus.objects.filter(votes__gt=0).update(
+                mean=F('total') / F('votes'),
+                variance=F('total_sq') / F('votes') - (F('total') / F('votes')) * (F('total') / F('votes'))
+            )
+
+            attribute_ids = set(Attribute.objects.values_list('id', flat=True))
+            detection_ids = sorted(detection_ids)
+            for i in range(0, len(detection_ids), chunk_size):
+                DetectionConsensus.update_weighted(detection_ids[i:i + chunk_size], attribute_ids)
+
+        print('Consensus rebuilt for %d values of %d hits' % (inserted, len(detection_ids)))
@@ -0,0 +1,35 @@
+# Generated by Django 3.0.7 on 2026-10-18 11:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('definitions', '0002_auto_20200526_1738'),
+        ('database', '0002_detection_crop_store'),
+        ('values', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionConsensus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('votes', models.IntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('total_sq', models.FloatField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('variance', models.FloatField(default=0)),
+                ('weighted', models.FloatField(default=0)),
+                ('attribute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='definitions.Attribute')),
+                ('detection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='database.Detection')),
+            ],
+            options={
+                'default_permissions': ('view', 'add', 'change', 'delete'),
+                'unique_together': {('detection', 'attribute')},
+                'index_together': {('attribute', 'weighted'), ('attribute', 'mean')},
+            },
+        ),
+    ]
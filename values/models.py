@@ -1,15 +1,39 @@
-from typing import Tuple
+from typing import Dict, Iterable, List, Tuple
 
+import numpy as np
 from django.db import models
+from django.db.models import F
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 from credo_classification.drf import DjangoPlusViewPermissionsMixin
+from database.ingest import upsert
 from database.models import Detection
-from definitions.models import Attribute
+from definitions.cache import get_attribute, get_relations
+from definitions.models import Attribute, Relation
 from users.models import User
 
 
+def evaluate_weights_or_zero(relation: Relation, src_values: List[float]) -> List[float]:
+    """
+    Evaluate weights of relation, the weight which evaluation fails (i.e. by division by zero) is 0,
+    so the invalid evaluation of relation never fails the write of classification.
+    :param relation: relation
+    :param src_values: values of source attribute
+    :return: weights of relation
+    """
+    try:
+        return relation.evaluate_weights(np.array(src_values)).tolist()
+    except ArithmeticError:
+        ret = []
+        for v in src_values:
+            try:
+                ret.append(relation.evaluate_weight(v))
+            except ArithmeticError:
+                ret.append(0.0)
+        return ret
+
+
 class DetectionAttribute(models.Model):
     """
     Attribute of cosmic-ray hit. Attribute was provided by various author and can be different by each author.
@@ -31,19 +55,129 @@ class DetectionAttribute(models.Model):
         :return: tuple with created entity and True or False when created or updated
         """
         created = True
+        attr = get_attribute(attribute)
         a = DetectionAttribute.objects.filter(
-            detection_id=detection_id, author=user, attribute__name=attribute
+            detection_id=detection_id, author=user, attribute=attr
         ).first()  # type: DetectionAttribute
         if a is None:
             a = DetectionAttribute.objects.create(
-                detection_id=detection_id, author=user, attribute=Attribute.objects.get(name=attribute), value=value
+                detection_id=detection_id, author=user, attribute=attr, value=value
             )
+            votes = {(detection_id, attr.id): (1, float(value), float(value) ** 2)}
         else:
+            votes = {(detection_id, attr.id): (0, float(value) - a.value, float(value) ** 2 - a.value ** 2)}
             a.value = value
             a.date = now()
             a.save()
             created = False
+        DetectionConsensus.add_votes(votes)
         return a, created
 
+    @staticmethod
+    def bulk_set_or_update_values(user: User, values: List[Tuple[int, str, float]]) -> List[bool]:
+        """
+        Store or update many attribute values by one query for existing values and one upsert query.
+        :param user: author of values
+        :param values: list of tuples: ID of detection hit, name of attribute, value of attribute
+        :return: list of True or False when value was created or updated, in order of values
+        """
+        attrs = {name: get_attribute(name) for name in set(v[1] for v in values)}
+        existing = {(d, a): v for d, a, v in DetectionAttribute.objects.filter(
+            author=user, detection_id__in=set(v[0] for v in values), attribute__in=attrs.values()
+        ).values_list('detection_id', 'attribute_id', 'value')}
+
+        to_upsert = {}
+        for detection_id, name, value in values:
+            to_upsert[(detection_id, attrs[name].id)] = DetectionAttribute(
+                detection_id=detection_id, author=user, attribute=attrs[name], value=value
+            )
+        upsert(DetectionAttribute, list(to_upsert.values()), ['detection', 'attribute', 'author'], ['value', 'date'])
+
+        votes = {}
+        for key, a in to_upsert.items():
+            value = float(a.value)
+            if key in existing:
+                votes[key] = (0, value - existing[key], value ** 2 - existing[key] ** 2)
+            else:
+                votes[key] = (1, value, value ** 2)
+        DetectionConsensus.add_votes(votes)
+
+        return [(detection_id, attrs[name].id) not in existing for detection_id, name, value in values]
+
     class Meta(DjangoPlusViewPermissionsMixin):
         unique_together = [['detection', 'attribute', 'author']]
+
+
+class DetectionConsensus(models.Model):
+    """
+    Consensus of authors about attribute of cosmic-ray hit, incrementally updated by every write of DetectionAttribute.
+
+    votes, total, total_sq - count, sum and sum of squares of values from DetectionAttribute
+    mean, variance - mean and variance (population) of values
+    weighted - sum of Relation.evaluate_weight() of relations to this attribute, evaluated with means of source attributes,
+               the weight of relation is 0 when its evaluation fails (i.e. division by zero)
+    """
+    detection = models.ForeignKey(Detection, on_delete=models.CASCADE)
+    attribute = models.ForeignKey(Attribute, on_delete=models.CASCADE)
+    votes = models.IntegerField(default=0)
+    total = models.FloatField(default=0)
+    total_sq = models.FloatField(default=0)
+    mean = models.FloatField(default=0)
+    variance = models.FloatField(default=0)
+    weighted = models.FloatField(default=0)
+
+    @staticmethod
+    def add_votes(votes: Dict[Tuple[int, int], Tuple[int, float, float]]) -> None:
+        """
+        Add diffs of values to consensus and update weighted of attributes related with changed attributes.
+        :param votes: diffs of votes, total and total_sq by detection ID and attribute ID
+        """
+        if not len(votes):
+            return
+
+        upsert(DetectionConsensus, [
+            DetectionConsensus(detection_id=d, attribute_id=a, votes=c, total=t, total_sq=ts) for (d, a), (c, t, ts) in votes.items()
+        ], ['detection', 'attribute'], [], ['votes', 'total', 'total_sq'])
+
+        detection_ids = set(d for d, a in votes.keys())
+        attribute_ids = set(a for d, a in votes.keys())
+        DetectionConsensus.objects.filter(detection_id__in=detection_ids, attribute_id__in=attribute_ids, votes__gt=0).update(
+            mean=F('total') / F('votes'),
+            variance=F('total_sq') / F('votes') - (F('total') / F('votes')) * (F('total') / F('votes'))
+        )
+        DetectionConsensus.update_weighted(detection_ids, attribute_ids)
+
+    @staticmethod
+    def update_weighted(detection_ids: Iterable[int], attribute_ids: Iterable[int]) -> None:
+        """
+        Evaluate weighted of attributes which are destinations of relations from changed attributes.
+        :param detection_ids: IDs of hits with changed consensus
+        :param attribute_ids: IDs of attributes with changed consensus
+        """
+        relations = get_relations()
+        dests = set(r.dest_id for r in relations if r.src_id in attribute_ids)
+        if not len(dests):
+            return
+
+        incoming = [r for r in relations if r.dest_id in dests]
+        means = {(d, a): mean for d, a, mean in DetectionConsensus.objects.filter(
+            detection_id__in=detection_ids, attribute_id__in=set(r.src_id for r in incoming), votes__gt=0
+        ).values_list('detection_id', 'attribute_id', 'mean')}
+
+        weighted = {(d, dest_id): 0.0 for d in detection_ids for dest_id in dests}
+        for r in incoming:
+            keys = [(d, r.src_id) for d in detection_ids if (d, r.src_id) in means]
+            if len(keys):
+                for (d, _), w in zip(keys, evaluate_weights_or_zero(r, [means[k] for k in keys])):
+                    weighted[(d, r.dest_id)] += w
+
+        upsert(DetectionConsensus, [
+            DetectionConsensus(detection_id=d, attribute_id=a, weighted=w) for (d, a), w in weighted.items()
+        ], ['detection', 'attribute'], ['weighted'])
+
+    class Meta(DjangoPlusViewPermissionsMixin):
+        unique_together = [['detection', 'attribute']]
+        index_together = [
+            ('attribute', 'mean'),
+            ('attribute', 'weighted'),
+        ]
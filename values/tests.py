@@ -1,3 +1,76 @@
+from random import Random
+
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from database.tests import create_detections
+from definitions.models import Attribute, Relation
+from users.models import User
+from values.models import DetectionAttribute, DetectionConsensus
+
+
+class ConsensusTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user('user%d' % i) for i in range(3)]
+        spot = Attribute.objects.create(name='spot', author=cls.users[0], kind='c')
+        Attribute.objects.create(name='class', author=cls.users[0], kind='co')
+        track = Attribute.objects.create(name='track', author=cls.users[0], kind='c')
+        cls.dest = Attribute.objects.create(name='particle', author=cls.users[0], kind='o')
+        Relation.objects.create(name='spot', author=cls.users[0], src=spot, dest=cls.dest, evaluation='x * 2')
+        Relation.objects.create(name='track', author=cls.users[0], src=track, dest=cls.dest, evaluation='x - 1')
+
+        create_detections(5)
+
+    def get_consensus(self) -> dict:
+        return {(d, a): row for d, a, *row in DetectionConsensus.objects.values_list(
+            'detection_id', 'attribute_id', 'votes', 'total', 'total_sq', 'mean', 'variance', 'weighted'
+        )}
+
+    def check_brute_force(self, consensus: dict) -> None:
+        values = {}
+        for d, a, v in DetectionAttribute.objects.values_list('detection_id', 'attribute_id', 'value'):
+            values.setdefault((d, a), []).append(v)
+
+        means = {}
+        for (d, a), vs in values.items():
+            votes, total, total_sq, mean, variance, weighted = consensus[(d, a)]
+            means[(d, a)] = sum(vs) / len(vs)
+            self.assertEqual((votes, total, total_sq), (len(vs), sum(vs), sum(v * v for v in vs)))
+            self.assertAlmostEqual(mean, means[(d, a)])
+            self.assertAlmostEqual(variance, sum((v - mean) ** 2 for v in vs) / len(vs))
+
+        relations = list(Relation.objects.all())
+        for (d, a), row in consensus.items():
+            if a == self.dest.id:
+                expected = sum(r.evaluate_weight(means[(d, r.src_id)]) for r in relations if (d, r.src_id) in means)
+                self.assertAlmostEqual(row[-1], expected)
+            elif (d, a) not in values:
+                self.assertEqual(row[0], 0)
+
+    def test_incremental_vs_rebuild(self):
+        rnd = Random(6)
+        for i in range(60):
+            user = rnd.choice(self.users)
+            if rnd.random() < 0.5:
+                DetectionAttribute.set_or_update_value(rnd.randint(1, 5), user, rnd.choice(['spot', 'track']), rnd.randint(1, 5))
+            else:
+                DetectionAttribute.bulk_set_or_update_values(user, [
+                    (rnd.randint(1, 5), rnd.choice(['spot', 'track']), rnd.randint(1, 5)) for j in range(rnd.randint(1, 4))
+                ])
+            consensus = self.get_consensus()
+            self.check_brute_force(consensus)
+
+        call_command('rebuild_consensus', chunk_size=2)
+        self.assertEqual(self.get_consensus(), consensus)
+
+    def test_evaluation_error(self):
+        Relation.objects.create(name='inverse', author=self.users[0], src=Attribute.objects.get(name='class'), dest=self.dest, evaluation='1 / x')
+
+        DetectionAttribute.set_or_update_value(1, self.users[0], 'class', 0)
+        DetectionAttribute.bulk_set_or_update_values(self.users[0], [(2, 'class', 4), (3, 'class', 0)])
+        DetectionAttribute.set_or_update_value(1, self.users[1], 'spot', 2)
+
+        self.assertEqual(DetectionAttribute.objects.count(), 4)
+        weighted = dict(DetectionConsensus.objects.filter(attribute=self.dest).values_list('detection_id', 'weighted'))
+        self.assertEqual(weighted, {1: 4.0, 2: 0.25, 3: 0.0})